@@ -1,5 +1,9 @@
-from flask import Flask, render_template
+from flask import Flask, render_template, jsonify, Response
 from flask_cors import CORS
+import click
+import multiprocessing
+import os
+import metrics
 
 app = Flask(__name__)
 # Set your secret key directly here
@@ -10,10 +14,21 @@ CORS(app)
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
+# Request timing for /metrics
+metrics.init_app(app)
+
 # Initialize Firebase
 from firebase.firebase_config import initialize_firebase
 initialize_firebase()
 
+# Forecast pool workers import this module again as __mp_main__; only the web process starts background work
+IS_WEB_PROCESS = multiprocessing.parent_process() is None
+
+# Optional in-process replica of open blood requests
+from firebase.request_mirror import REQUEST_MIRROR_ENABLED, start_request_mirror
+if REQUEST_MIRROR_ENABLED and IS_WEB_PROCESS:
+    start_request_mirror()
+
 # Register blueprints
 from routes.auth import auth_bp
 from routes.people import people_bp
@@ -23,9 +38,106 @@ app.register_blueprint(auth_bp, url_prefix='/auth')
 app.register_blueprint(people_bp, url_prefix='/people')
 app.register_blueprint(hospital_bp, url_prefix='/hospital')
 
+# Dedicated forecast workers set this so the model stack is loaded before the first upload
+if os.environ.get('BLOODLINK_FORECAST_WARMUP') == '1' and IS_WEB_PROCESS:
+    from ml.forecast import warm_up
+    warm_up()
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/metrics')
+def prometheus_metrics():
+    from firebase.user_cache import cache_stats
+    from firebase.request_mirror import mirror_stats
+    from firebase.loader import transfer_stats
+
+    gauges = {}
+    for prefix, stats in (('bloodlink_user_cache', cache_stats()), ('bloodlink_request_mirror', mirror_stats())):
+        for key, value in stats.items():
+            if isinstance(value, (bool, int, float)):
+                gauges[f'{prefix}_{key}'] = int(value) if isinstance(value, bool) else value
+    # One family per counter, labelled by the read's path pattern
+    transfers = transfer_stats()
+    gauges['bloodlink_read_bytes'] = [({'path': label}, counts['bytes']) for label, counts in transfers.items()]
+    gauges['bloodlink_reads'] = [({'path': label}, counts['reads']) for label, counts in transfers.items()]
+
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache-stats')
+def user_cache_stats():
+    from firebase.user_cache import cache_stats
+    return jsonify(cache_stats())
+
+@app.route('/transfer-stats')
+def read_transfer_stats():
+    from firebase.loader import transfer_stats
+    return jsonify(transfer_stats())
+
+@app.route('/forecast-cache-stats')
+def forecast_cache_stats():
+    from ml.forecast_cache import cache_stats
+    return jsonify(cache_stats())
+
+@app.route('/model-store-stats')
+def model_store_stats():
+    from ml.model_store import store_stats
+    return jsonify(store_stats())
+
+@app.route('/forecast-budget-stats')
+def forecast_budget_stats():
+    from ml.scheduler import cost_stats
+    return jsonify(cost_stats())
+
+@app.route('/mirror-stats')
+def request_mirror_stats():
+    from firebase.request_mirror import mirror_stats
+    return jsonify(mirror_stats())
+
+@app.cli.command('backfill-indexes')
+def backfill_indexes():
+    """Build secondary index nodes for existing data (one-off)"""
+    from firebase.firestore_service import (
+        backfill_donation_indexes, backfill_geo_index, backfill_open_requests, backfill_request_index
+    )
+    print(backfill_donation_indexes())
+    print(backfill_request_index())
+    print(backfill_geo_index())
+    print(backfill_open_requests())
+
+@app.cli.command('reconcile-slots')
+@click.option('--fix', is_flag=True, help='Write the recomputed counters back')
+def reconcile_slots(fix):
+    """Recompute slot counters on blood_requests and report drift"""
+    from firebase.firestore_service import reconcile_slot_counters
+    result = reconcile_slot_counters(fix=fix)
+    for item in result.get('drift', []):
+        print(f"{item['request_id']}: stored {item['stored']} actual {item['actual']}")
+    print({k: v for k, v in result.items() if k != 'drift'})
+
+@app.cli.command('compact-records')
+@click.option('--older-than-days', type=int, default=None, help='Archive records closed at least this long ago')
+@click.option('--dry-run', is_flag=True, help='Only count what would be expired and archived')
+def compact_records(older_than_days, dry_run):
+    """Expire stale requests and donations, then archive closed ones (run daily from cron)"""
+    from firebase.firestore_service import ARCHIVE_AFTER_DAYS, archive_closed_records, expire_stale_records
+    print(expire_stale_records(dry_run=dry_run))
+    days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    print(archive_closed_records(older_than_days=days, dry_run=dry_run))
+
+@app.cli.command('benchmark', context_settings={'ignore_unknown_options': True})
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def benchmark(args):
+    """Time the service layer on synthetic data (see benchmarks/suite.py for options)"""
+    from benchmarks.suite import main
+    raise SystemExit(main(list(args)))
+
+@app.cli.command('import-report')
+def import_report():
+    """Show import time per package and peak RSS for worker startup"""
+    from startup import print_import_report
+    print_import_report()
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,225 @@
+"""Synthetic BloodLink data for benchmarks and load tests.
+
+generate_dataset() builds a database tree shaped exactly like the one the
+services write (users, blood_requests, donations and every index node), so it
+can be loaded with ``get_db().set(tree)`` on a local backend.
+generate_demand_csv() writes hospital usage history in the format
+ml/preprocess.py reads.
+"""
+from firebase.firestore_service import _geo_entry, _geo_key
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import random
+import string
+import uuid
+
+SCALES = {'1k': 1_000, '10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+# Share of records per node; every remaining record is a donation
+USER_SHARE = 0.2
+REQUEST_SHARE = 0.3
+
+# Approximate ABO/Rh frequencies
+BLOOD_TYPES = ['O+', 'A+', 'B+', 'AB+', 'O-', 'A-', 'B-', 'AB-']
+BLOOD_TYPE_WEIGHTS = [0.38, 0.34, 0.09, 0.03, 0.07, 0.06, 0.02, 0.01]
+
+# Requests and donors cluster around a few cities
+CITY_CENTRES = [(6.9271, 79.8612), (7.2906, 80.6337), (6.0535, 80.2210), (9.6615, 80.0255), (8.3114, 80.4037)]
+CITY_SPREAD_DEG = 0.12
+
+DEPARTMENTS = ['Emergency', 'Surgery', 'Oncology', 'Maternity', 'Pediatrics', 'ICU']
+HOSPITALS = ['General Hospital', 'Teaching Hospital', 'Base Hospital', 'District Hospital']
+
+HISTORY_DAYS = 180
+
+
+def parse_scale(value):
+    """'100k', '1M' or a plain number of records"""
+    key = str(value).strip().lower()
+    if key in SCALES:
+        return SCALES[key]
+    return int(key)
+
+
+def _uid(rng):
+    return ''.join(rng.choices(string.ascii_letters + string.digits, k=28))
+
+
+def _location(rng):
+    lat, lng = rng.choice(CITY_CENTRES)
+    return {
+        'latitude': round(lat + rng.gauss(0, CITY_SPREAD_DEG), 6),
+        'longitude': round(lng + rng.gauss(0, CITY_SPREAD_DEG), 6),
+        'address': f'{rng.randint(1, 400)} Main Street'
+    }
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _timestamp(rng, end, days=HISTORY_DAYS):
+    return (end - timedelta(seconds=rng.randint(0, days * 86400))).isoformat()
+
+
+def generate_dataset(records, seed=42, end=None):
+    """Database tree with about `records` users, blood requests and donations in total.
+
+    Slot counters, donor maps, statuses and index nodes are consistent with each
+    other, as reconcile_slot_counters would find them.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.utcnow()
+
+    n_users = max(int(records * USER_SHARE), 2)
+    n_requests = max(int(records * REQUEST_SHARE), 1)
+    n_donations = max(records - n_users - n_requests, 0)
+
+    users = {}
+    for _ in range(n_users):
+        uid = _uid(rng)
+        users[uid] = {
+            'uid': uid,
+            'email': f'{uid[:10].lower()}@example.com',
+            'name': f'Donor {uid[:6]}',
+            'age': rng.randint(18, 65),
+            'sex': rng.choice(['male', 'female']),
+            'blood_type': rng.choices(BLOOD_TYPES, BLOOD_TYPE_WEIGHTS)[0],
+            'email_verified': rng.random() < 0.8,
+            'blood_credits': 0,
+            'donations': 0,
+            'requests': 0,
+            'location': _location(rng) if rng.random() < 0.7 else None,
+            'created_at': _timestamp(rng, end, days=HISTORY_DAYS * 2)
+        }
+    uids = list(users)
+
+    blood_requests = {}
+    requests_by_requester = {}
+    for _ in range(n_requests):
+        rid = _uuid(rng)
+        units = rng.choices([1, 2, 3, 4, 6], [0.35, 0.3, 0.15, 0.15, 0.05])[0]
+        request = {
+            'blood_type': rng.choices(BLOOD_TYPES, BLOOD_TYPE_WEIGHTS)[0],
+            'units': units,
+            'location': _location(rng),
+            'status': 'pending',
+            'slots_filled': 0,
+            'slots_available': units,
+            'created_at': _timestamp(rng, end)
+        }
+        if rng.random() < 0.2:
+            request.update({'hospital_name': rng.choice(HOSPITALS), 'type': 'hospital',
+                            'urgency': rng.choice(['normal', 'urgent', 'critical'])})
+        else:
+            requester = rng.choice(uids)
+            request.update({'requester_uid': requester, 'special_requirements': '',
+                            'fulfilled_by': None, 'fulfilled_at': None})
+            requests_by_requester.setdefault(requester, {})[rid] = request['created_at']
+            users[requester]['requests'] += 1
+        blood_requests[rid] = request
+
+    donations = {}
+    donations_by_request = {}
+    donations_by_donor = {}
+    request_ids = list(blood_requests)
+    attempts = 0
+    while len(donations) < n_donations and attempts < n_donations * 4:
+        attempts += 1
+        rid = rng.choice(request_ids)
+        request = blood_requests[rid]
+        donor_uid = rng.choice(uids)
+        donors = request.setdefault('donors', {})
+        if request['slots_available'] <= 0 or donor_uid in donors:
+            continue
+
+        did = _uuid(rng)
+        accepted_at = max(request['created_at'], _timestamp(rng, end))
+        completed = accepted_at < (end - timedelta(days=3)).isoformat() and rng.random() < 0.85
+        taken = {d['verification_code'] for d in donors.values()}
+        code = next(c for c in iter(lambda: str(rng.randint(1000, 9999)), None) if c not in taken)
+        donations[did] = {
+            'request_id': rid,
+            'donor_uid': donor_uid,
+            'requester_uid': request.get('requester_uid'),
+            'blood_type': request['blood_type'],
+            'donation_date': accepted_at[:10],
+            'donation_time': f'{rng.randint(8, 17):02d}:00',
+            'verification_code': code,
+            'status': 'completed' if completed else 'pending',
+            'accepted_at': accepted_at,
+            'verified_at': accepted_at if completed else None,
+            'location': request['location']
+        }
+        donations_by_request.setdefault(rid, {})[did] = accepted_at
+        donations_by_donor.setdefault(donor_uid, {})[did] = accepted_at
+        donors[donor_uid] = {'donation_id': did, 'status': donations[did]['status'], 'verification_code': code}
+
+        request['slots_filled'] += 1
+        request['slots_available'] -= 1
+        if completed:
+            users[donor_uid]['blood_credits'] += 100
+            users[donor_uid]['donations'] += 1
+
+    pending_geo = {}
+    open_requests = {}
+    for rid, request in blood_requests.items():
+        donors = request.get('donors') or {}
+        if donors and all(d['status'] == 'completed' for d in donors.values()):
+            request['status'] = 'fulfilled'
+            request['fulfilled_at'] = max(donations[d['donation_id']]['verified_at'] for d in donors.values())
+        elif request['slots_available'] == 0:
+            request['status'] = 'all_slots_filled'
+        if request['status'] == 'pending':
+            open_requests[rid] = request['created_at']
+            pending_geo[_geo_key(rid, request['location'])] = _geo_entry(rid, request['location'])
+
+    return {
+        'users': users,
+        'blood_requests': blood_requests,
+        'donations': donations,
+        'requests_by_requester': requests_by_requester,
+        'donations_by_request': donations_by_request,
+        'donations_by_donor': donations_by_donor,
+        'pending_geo': pending_geo,
+        'open_requests': open_requests
+    }
+
+
+def generate_demand_csv(path, days=HISTORY_DAYS, departments=DEPARTMENTS, rows_per_day=None, seed=42, end=None):
+    """Write hospital blood usage history (timestamp, department, blood_type, units) to a CSV.
+
+    Each department/blood type group follows a weekly cycle with a slow trend and
+    noise, split over several transfusion events per day. rows_per_day sets the
+    total number of rows per day across all groups (default: about 4 per group).
+    Returns the number of rows written.
+    """
+    np_rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end or datetime.utcnow()).normalize()
+    dates = pd.date_range(end=end, periods=days, freq='D')
+    groups = [(dept, bt) for dept in departments for bt in BLOOD_TYPES]
+    rows_per_day = rows_per_day or 4 * len(groups)
+
+    # Expected daily units per group: weekday cycle, trend and group size
+    weekday = np.array([1.15, 1.1, 1.05, 1.0, 1.1, 0.75, 0.7])[dates.dayofweek]
+    trend = np.linspace(0.9, 1.1, days)
+    group_weight = np.array([BLOOD_TYPE_WEIGHTS[BLOOD_TYPES.index(bt)] for _, bt in groups])
+    group_weight = group_weight * np_rng.uniform(0.5, 1.5, len(groups))
+    group_weight = group_weight / group_weight.sum()
+
+    n_rows = rows_per_day * days
+    day_index = np.repeat(np.arange(days), rows_per_day)
+    group_index = np_rng.choice(len(groups), size=n_rows, p=group_weight)
+    base = 2.0 * weekday[day_index] * trend[day_index]
+    units = np.maximum(np_rng.poisson(base), 1)
+    seconds = np_rng.integers(0, 86400, n_rows)
+
+    frame = pd.DataFrame({
+        'timestamp': dates[day_index] + pd.to_timedelta(seconds, unit='s'),
+        'department': [groups[i][0] for i in group_index],
+        'blood_type': [groups[i][1] for i in group_index],
+        'units': units
+    })
+    frame.to_csv(path, index=False)
+    return n_rows
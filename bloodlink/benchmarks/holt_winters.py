@@ -0,0 +1,124 @@
+"""Holt-Winters benchmark: the batch NumPy engine against per-series statsmodels fits.
+
+    python -m benchmarks.holt_winters --days 365
+
+Writes a synthetic hospital file, times ml.holt_winters.fit_series over
+every group with at least BATCH_MIN_LENGTH days (the ones ml.forecast fits
+in batch) against ExponentialSmoothing(...).fit() per group, and compares
+the 7-day totals. The deviation of a group is |fast - statsmodels| divided by
+its mean weekly demand. The run fails when a group deviates by more than
+--tolerance and the batch fit does not have the lower SSE either, the
+agreement ml.holt_winters states.
+"""
+from benchmarks.datagen import DEPARTMENTS, generate_demand_csv
+from benchmarks.suite import _git_revision, time_calls, write_report
+from ml.holt_winters import BATCH_MIN_LENGTH, SEASON, fit_series
+from ml.preprocess import load_and_preprocess_data, build_daily_matrix, series_from_matrix
+from datetime import datetime
+import argparse
+import os
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+
+HORIZON = 7
+# Deviation within which every group agrees unless the batch fit has the lower SSE, as stated in ml.holt_winters
+TOLERANCE = 0.05
+
+
+def _statsmodels_fits(series_list):
+    """(forecasts, sse) from one ExponentialSmoothing fit per series"""
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        fits = [ExponentialSmoothing(series, trend='add', seasonal='add', seasonal_periods=SEASON).fit()
+                for series in series_list]
+    return np.array([fit.forecast(HORIZON).to_numpy() for fit in fits]), np.array([fit.sse for fit in fits])
+
+
+def run_holt_winters(days=365, departments=len(DEPARTMENTS), rows_per_day=None, seed=42, repeat=3):
+    with tempfile.TemporaryDirectory(prefix='bloodlink-bench-') as tmp:
+        path = os.path.join(tmp, 'demand.csv')
+        rows = generate_demand_csv(path, days=days, departments=DEPARTMENTS[:departments],
+                                   rows_per_day=rows_per_day, seed=seed)
+        df, _ = load_and_preprocess_data(path)
+
+    matrix = build_daily_matrix(df)
+    groups = [(' / '.join(column), series_from_matrix(matrix, *column)) for column in matrix.columns]
+    groups = [(name, s) for name, s in groups if s is not None and len(s) >= BATCH_MIN_LENGTH]
+    series_list = [s for _, s in groups]
+
+    outputs = {}
+
+    def fast():
+        outputs['fast'] = fit_series(series_list, HORIZON)
+
+    def reference():
+        outputs['statsmodels'] = _statsmodels_fits(series_list)
+
+    results = [
+        time_calls('holt_winters.fit_series[all groups]', 'fit_series', [fast] * repeat),
+        time_calls('ExponentialSmoothing.fit[every group]', 'ExponentialSmoothing', [reference])
+    ]
+
+    weekly = np.array([HORIZON * max(float(s.mean()), 1e-9) for s in series_list])
+    (fast, fast_sse), (reference, reference_sse) = outputs['fast'], outputs['statsmodels']
+    deviation = np.abs(fast.sum(axis=1) - reference.sum(axis=1)) / weekly
+    better_fit = fast_sse < reference_sse
+
+    return {
+        'meta': {
+            'scale': f'{len(series_list)} series x {days} days',
+            'rows': rows,
+            'groups': len(series_list),
+            'days': days,
+            'revision': _git_revision(),
+            'created_at': datetime.utcnow().isoformat(),
+            'better_fit_groups': int(better_fit.sum()),
+            'deviation': {f'p{q}': round(float(np.percentile(deviation, q)), 4) for q in (50, 90, 95, 100)},
+            'groups_by_deviation': [{'group': groups[i][0], 'length': len(series_list[i]),
+                                     'deviation': round(float(deviation[i]), 4), 'fast_sse_lower': bool(better_fit[i])}
+                                    for i in np.argsort(-deviation)]
+        },
+        'results': results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark batch Holt-Winters against statsmodels')
+    parser.add_argument('--days', type=int, default=365, help=f'at least {BATCH_MIN_LENGTH}')
+    parser.add_argument('--departments', type=int, default=len(DEPARTMENTS))
+    parser.add_argument('--rows-per-day', type=int)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='deviation allowed for a group whose batch fit has the higher SSE, '
+                             'as a fraction of weekly demand')
+    parser.add_argument('--out', help='write the report to this .json or .csv file')
+    args = parser.parse_args(argv)
+    if args.days < BATCH_MIN_LENGTH:
+        parser.error(f'--days must be at least {BATCH_MIN_LENGTH}; shorter series are not fitted in batch')
+
+    report = run_holt_winters(args.days, args.departments, args.rows_per_day, args.seed, args.repeat)
+    meta = report['meta']
+    print(f"{meta['groups']} groups over {meta['days']} days ({meta['rows']} rows)")
+    for r in report['results']:
+        print(f"{r['name']:<45} median {r['median_ms']:>10.1f} ms  min {r['min_ms']:>10.1f} ms")
+    print('deviation of 7-day totals / weekly demand: ' +
+          ', '.join(f'{k} {v:.2%}' for k, v in meta['deviation'].items()))
+    print(f"batch fit has the lower SSE for {meta['better_fit_groups']} groups")
+    if args.out:
+        write_report(report, args.out)
+
+    outside = [group for group in meta['groups_by_deviation']
+               if group['deviation'] > args.tolerance and not group['fast_sse_lower']]
+    for group in outside:
+        print(f"{group['group']} ({group['length']} days) deviates by {group['deviation']:.2%}, "
+              f"above the {args.tolerance:.2%} tolerance, with the higher SSE")
+    return 1 if outside else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Preprocessing benchmark: per-group filtering against the single-pass daily matrix.
+
+    python -m benchmarks.preprocessing --rows 1000000
+
+Writes a synthetic hospital file with the given number of rows, then times
+load_and_preprocess_data, every get_clean_series call and the
+build_daily_matrix + series_from_matrix path, and checks that both paths
+produce the same series.
+"""
+from benchmarks.datagen import DEPARTMENTS, generate_demand_csv
+from benchmarks.suite import _git_revision, time_calls, write_report
+from ml.preprocess import load_and_preprocess_data, get_clean_series, build_daily_matrix, series_from_matrix
+from datetime import datetime
+import argparse
+import os
+import sys
+import tempfile
+
+
+def _groups(df):
+    return [(dept, bt) for dept in df['department'].unique()
+            for bt in df[df['department'] == dept]['blood_type'].unique()]
+
+
+def _per_group(df, groups):
+    return {group: get_clean_series(df, *group) for group in groups}
+
+
+def _single_pass(df, groups):
+    matrix = build_daily_matrix(df)
+    return {group: series_from_matrix(matrix, *group) for group in groups}
+
+
+def run_preprocessing(rows=1_000_000, days=365, departments=len(DEPARTMENTS), seed=42, repeat=3):
+    departments = DEPARTMENTS[:departments]
+    with tempfile.TemporaryDirectory(prefix='bloodlink-bench-') as tmp:
+        path = os.path.join(tmp, 'demand.csv')
+        rows = generate_demand_csv(path, days=days, departments=departments,
+                                   rows_per_day=max(rows // days, 1), seed=seed)
+        loaded = {}
+
+        def load():
+            loaded['df'], _ = load_and_preprocess_data(path)
+
+        results = [time_calls('load_and_preprocess_data', 'load_and_preprocess_data', [load] * repeat)]
+
+    df = loaded['df']
+    groups = _groups(df)
+    results.append(time_calls('get_clean_series[every group]', 'get_clean_series',
+                              [lambda: _per_group(df, groups)] * repeat))
+    results.append(time_calls('build_daily_matrix+series_from_matrix', 'build_daily_matrix',
+                              [lambda: _single_pass(df, groups)] * repeat))
+
+    expected, actual = _per_group(df, groups), _single_pass(df, groups)
+    mismatched = [f'{dept}/{bt}' for dept, bt in groups
+                  if not expected[(dept, bt)].astype(float).equals(actual[(dept, bt)])]
+
+    return {
+        'meta': {
+            'scale': f'{rows} rows',
+            'rows': rows,
+            'groups': len(groups),
+            'days': days,
+            'revision': _git_revision(),
+            'created_at': datetime.utcnow().isoformat(),
+            'mismatched_groups': mismatched
+        },
+        'results': results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark demand-file preprocessing')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--departments', type=int, default=len(DEPARTMENTS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', help='write the report to this .json or .csv file')
+    args = parser.parse_args(argv)
+
+    report = run_preprocessing(args.rows, args.days, args.departments, args.seed, args.repeat)
+    meta = report['meta']
+    print(f"{meta['rows']} rows, {meta['groups']} groups over {meta['days']} days")
+    for r in report['results']:
+        print(f"{r['name']:<40} median {r['median_ms']:>10.1f} ms  min {r['min_ms']:>10.1f} ms")
+    if meta['mismatched_groups']:
+        print(f"series differ for: {', '.join(meta['mismatched_groups'])}")
+    if args.out:
+        write_report(report, args.out)
+    return 1 if meta['mismatched_groups'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,348 @@
+"""Service-layer benchmark against a synthetic dataset.
+
+    python -m benchmarks.suite --scale 100k --out before.json
+    python -m benchmarks.suite --scale 100k --out after.json
+    python -m benchmarks.suite --compare before.json after.json
+
+(or: flask benchmark ...). The dataset is loaded into a local backend, so the
+timings measure how much data each service call scans and processes, not
+network latency to the hosted database. Run both revisions at the same scale
+and seed; --compare exits non-zero when a case got slower than --threshold.
+"""
+from firebase.firebase_config import use_backend
+from firebase.loader import transfer_stats
+from firebase import firestore_service as service
+from benchmarks.datagen import generate_dataset, generate_demand_csv, parse_scale
+from datetime import datetime
+import argparse
+import csv
+import inspect
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+REPORT_FIELDS = ['name', 'function', 'calls', 'errors', 'min_ms', 'median_ms', 'p95_ms', 'mean_ms', 'max_ms',
+                 'tracked_bytes_per_call']
+
+
+class Fixture:
+    """Ids picked from the loaded dataset; each write case draws from its own pool so runs never collide"""
+
+    def __init__(self, tree, seed):
+        rng = random.Random(seed)
+        requests = tree['blood_requests']
+        donations = tree['donations']
+
+        self.requesters = list(tree['requests_by_requester'])
+        self.donors = list(tree['donations_by_donor'])
+        self.uids = list(tree['users'])
+        self.request_ids = list(requests)
+        self.requests_with_donations = list(tree['donations_by_request'])
+        self.owned_requests = [(uid, rid) for uid, rids in tree['requests_by_requester'].items() for rid in rids]
+        self.open_requests = [rid for rid, r in requests.items()
+                              if r['status'] == 'pending' and r['slots_available'] > 0]
+        self.locations = [u['location'] for u in tree['users'].values() if u.get('location')]
+
+        pending = [(did, d) for did, d in donations.items() if d['status'] == 'pending']
+        rng.shuffle(pending)
+        half = len(pending) // 2
+        self.to_verify = pending[:half]
+        self.to_delete = pending[half:]
+
+        for pool in (self.requesters, self.donors, self.uids, self.request_ids, self.requests_with_donations,
+                     self.owned_requests, self.open_requests, self.locations):
+            rng.shuffle(pool)
+
+    @staticmethod
+    def pick(pool, i):
+        return pool[i % len(pool)] if pool else None
+
+
+def _percentile(sorted_values, q):
+    index = min(int(round(q * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def _tracked_bytes():
+    return sum(counts['bytes'] for counts in transfer_stats().values())
+
+
+def _failed(result):
+    return isinstance(result, dict) and result.get('success') is False
+
+
+def time_calls(name, function, calls):
+    """Run each zero-argument call once and summarize the timings"""
+    timings = []
+    errors = 0
+    bytes_before = _tracked_bytes()
+
+    for call in calls:
+        start = time.perf_counter()
+        try:
+            result = call()
+        except Exception:
+            result = {'success': False}
+        timings.append((time.perf_counter() - start) * 1000)
+        errors += _failed(result)
+
+    timings.sort()
+    n = len(timings)
+    return {
+        'name': name,
+        'function': function,
+        'calls': n,
+        'errors': errors,
+        'min_ms': round(timings[0], 3) if n else None,
+        'median_ms': round(_percentile(timings, 0.5), 3) if n else None,
+        'p95_ms': round(_percentile(timings, 0.95), 3) if n else None,
+        'mean_ms': round(sum(timings) / n, 3) if n else None,
+        'max_ms': round(timings[-1], 3) if n else None,
+        'tracked_bytes_per_call': round((_tracked_bytes() - bytes_before) / n) if n else None
+    }
+
+
+def service_cases(fx, repeat):
+    """(case name, function name, [calls]) for every public function in firestore_service.
+
+    Reads come first, then writes, then the whole-node maintenance jobs, so the
+    reads see the dataset as generated.
+    """
+    pick = Fixture.pick
+    r = range(repeat)
+
+    def near(i):
+        return pick(fx.locations, i)
+
+    return [
+        ('get_child_keys', 'get_child_keys',
+         [lambda i=i: service.get_child_keys(f'donations_by_request/{pick(fx.requests_with_donations, i)}') for i in r]),
+        ('count_children', 'count_children',
+         [lambda i=i: service.count_children(f'requests_by_requester/{pick(fx.requesters, i)}') for i in r]),
+        ('count_request_donations', 'count_request_donations',
+         [lambda i=i: service.count_request_donations(pick(fx.requests_with_donations, i)) for i in r]),
+        ('get_user_request_ids', 'get_user_request_ids',
+         [lambda i=i: service.get_user_request_ids(pick(fx.requesters, i)) for i in r]),
+        ('get_request_status', 'get_request_status',
+         [lambda i=i: service.get_request_status(pick(fx.request_ids, i)) for i in r]),
+        ('get_pending_requests[all]', 'get_pending_requests',
+         [lambda: service.get_pending_requests() for _ in r]),
+        ('get_pending_requests[page]', 'get_pending_requests',
+         [lambda: service.get_pending_requests(limit=20) for _ in r]),
+        ('get_pending_requests[nearby]', 'get_pending_requests',
+         [lambda i=i: service.get_pending_requests(near(i), max_distance_km=25) for i in r]),
+        ('get_pending_requests[nearby,page]', 'get_pending_requests',
+         [lambda i=i: service.get_pending_requests(near(i), max_distance_km=25, limit=20) for i in r]),
+        ('get_user_requests[all]', 'get_user_requests',
+         [lambda i=i: service.get_user_requests(pick(fx.requesters, i)) for i in r]),
+        ('get_user_requests[page]', 'get_user_requests',
+         [lambda i=i: service.get_user_requests(pick(fx.requesters, i), limit=20) for i in r]),
+        ('get_user_request', 'get_user_request',
+         [lambda i=i: service.get_user_request(*pick(fx.owned_requests, i)) for i in r]),
+        ('get_user_donations[all]', 'get_user_donations',
+         [lambda i=i: service.get_user_donations(pick(fx.donors, i)) for i in r]),
+        ('get_user_donations[page]', 'get_user_donations',
+         [lambda i=i: service.get_user_donations(pick(fx.donors, i), limit=20) for i in r]),
+        ('get_request_donations', 'get_request_donations',
+         [lambda i=i: service.get_request_donations(pick(fx.requests_with_donations, i)) for i in r]),
+        ('create_blood_request', 'create_blood_request',
+         [lambda i=i: service.create_blood_request(pick(fx.uids, i), 'O+', 2, near(i)) for i in r]),
+        ('create_hospital_request', 'create_hospital_request',
+         [lambda i=i: service.create_hospital_request('Benchmark Hospital', near(i), 'A-', 3) for i in r]),
+        ('accept_donation_slot', 'accept_donation_slot',
+         [lambda i=i: service.accept_donation_slot(pick(fx.open_requests, i), pick(fx.uids, i + 1),
+                                                   '2025-01-01', '10:00') for i in r]),
+        ('verify_donation', 'verify_donation',
+         [lambda d=d: service.verify_donation(d[1]['request_id'], d[1]['verification_code'])
+          for d in fx.to_verify[:repeat]]),
+        ('delete_user_donation', 'delete_user_donation',
+         [lambda d=d: service.delete_user_donation(d[0], d[1]['donor_uid']) for d in fx.to_delete[:repeat]]),
+        ('update_user_location', 'update_user_location',
+         [lambda i=i: service.update_user_location(pick(fx.uids, i), 6.9, 79.9, 'Benchmark Road') for i in r]),
+        ('backfill_request_index', 'backfill_request_index', [service.backfill_request_index]),
+        ('backfill_donation_indexes', 'backfill_donation_indexes', [service.backfill_donation_indexes]),
+        ('backfill_geo_index', 'backfill_geo_index', [service.backfill_geo_index]),
+        ('backfill_open_requests', 'backfill_open_requests', [service.backfill_open_requests]),
+        ('reconcile_slot_counters', 'reconcile_slot_counters', [service.reconcile_slot_counters]),
+        ('expire_stale_records', 'expire_stale_records', [service.expire_stale_records]),
+        ('archive_closed_records', 'archive_closed_records', [service.archive_closed_records]),
+    ]
+
+
+def public_service_functions():
+    return sorted(name for name, obj in inspect.getmembers(service, inspect.isfunction)
+                  if not name.startswith('_') and obj.__module__ == service.__name__ and name != 'now')
+
+
+def _git_revision():
+    try:
+        proc = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+        return proc.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_suite(scale='10k', repeat=20, seed=42, backend='memory', sqlite_path=None,
+              forecast=True, forecast_days=120, forecast_departments=2):
+    """Load a synthetic dataset into a local backend, time every service case and return the report"""
+    records = parse_scale(scale)
+
+    started = time.perf_counter()
+    tree = generate_dataset(records, seed=seed)
+    generate_s = time.perf_counter() - started
+
+    if backend == 'sqlite':
+        sqlite_path = sqlite_path or os.path.join(tempfile.mkdtemp(prefix='bloodlink-bench-'), 'bench.db')
+        db = use_backend('sqlite', sqlite_path)
+    else:
+        db = use_backend('memory')
+
+    started = time.perf_counter()
+    db.set(tree)
+    load_s = time.perf_counter() - started
+
+    fixture = Fixture(tree, seed)
+    counts = {node: len(tree[node]) for node in ('users', 'blood_requests', 'donations')}
+    del tree
+
+    results = [time_calls(*case) for case in service_cases(fixture, repeat)]
+    covered = {result['function'] for result in results}
+
+    if forecast:
+        from benchmarks.datagen import DEPARTMENTS
+        with tempfile.TemporaryDirectory(prefix='bloodlink-bench-') as tmp:
+            path = os.path.join(tmp, 'demand.csv')
+            rows = generate_demand_csv(path, days=forecast_days, departments=DEPARTMENTS[:forecast_departments],
+                                       seed=seed)
+            # Time the models, not results an earlier run left on disk: the forecast cache
+            # and model store are off here, and the variables carry that to pool workers
+            os.environ['BLOODLINK_FORECAST_CACHE'] = os.environ['BLOODLINK_MODEL_STORE'] = '0'
+            from ml import forecast_cache, model_store
+            from ml.forecast import predict_blood_demand
+            forecast_cache.FORECAST_CACHE_ENABLED = model_store.MODEL_STORE_ENABLED = False
+            result = time_calls(f'predict_blood_demand[{rows} rows]', 'predict_blood_demand',
+                                [lambda: predict_blood_demand(path)])
+            results.append(result)
+
+    return {
+        'meta': {
+            'scale': scale,
+            'records': counts,
+            'seed': seed,
+            'repeat': repeat,
+            'backend': backend,
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'created_at': datetime.utcnow().isoformat(),
+            'generate_s': round(generate_s, 3),
+            'load_s': round(load_s, 3),
+            'uncovered': [name for name in public_service_functions() if name not in covered]
+        },
+        'results': results
+    }
+
+
+def write_report(report, path):
+    """JSON, or CSV (results only, with scale and revision on every row) when path ends in .csv"""
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['scale', 'revision'] + REPORT_FIELDS)
+            writer.writeheader()
+            for result in report['results']:
+                writer.writerow({'scale': report['meta']['scale'], 'revision': report['meta']['revision'], **result})
+    else:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def load_report(path):
+    if path.endswith('.csv'):
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        results = [{k: (float(v) if k.endswith('_ms') and v else v) for k, v in row.items()} for row in rows]
+        return {'meta': {'scale': rows[0]['scale'] if rows else None}, 'results': results}
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_reports(old, new, threshold=1.25, min_delta_ms=0.5):
+    """Median time ratio (new / old) per case.
+
+    A case regresses when the ratio exceeds threshold and it also got slower by
+    more than min_delta_ms, so sub-millisecond jitter is not flagged.
+    """
+    old_results = {r['name']: r for r in old['results']}
+    rows = []
+    for result in new['results']:
+        before = old_results.get(result['name'])
+        if not before or not before.get('median_ms') or result.get('median_ms') is None:
+            continue
+        ratio = result['median_ms'] / before['median_ms']
+        rows.append({
+            'name': result['name'],
+            'old_ms': before['median_ms'],
+            'new_ms': result['median_ms'],
+            'ratio': round(ratio, 3),
+            'regressed': ratio > threshold and result['median_ms'] - before['median_ms'] > min_delta_ms
+        })
+    return rows
+
+
+def print_report(report):
+    meta = report['meta']
+    print(f"scale {meta['scale']} {meta['records']} on {meta['backend']}, revision {meta['revision']}; "
+          f"generated in {meta['generate_s']}s, loaded in {meta['load_s']}s")
+    print(f"{'case':<40} {'calls':>5} {'err':>4} {'median ms':>10} {'p95 ms':>10} {'bytes/call':>11}")
+    for r in report['results']:
+        print(f"{r['name']:<40} {r['calls']:>5} {r['errors']:>4} {r['median_ms'] or 0:>10.2f} "
+              f"{r['p95_ms'] or 0:>10.2f} {r['tracked_bytes_per_call'] or 0:>11}")
+    if meta['uncovered']:
+        print(f"not benchmarked: {', '.join(meta['uncovered'])}")
+
+
+def print_comparison(rows, threshold):
+    print(f"{'case':<40} {'old ms':>10} {'new ms':>10} {'ratio':>7}")
+    for row in rows:
+        flag = '  REGRESSION' if row['regressed'] else ''
+        print(f"{row['name']:<40} {row['old_ms']:>10.2f} {row['new_ms']:>10.2f} {row['ratio']:>7.2f}{flag}")
+    regressed = sum(row['regressed'] for row in rows)
+    print(f'{regressed} of {len(rows)} cases slower than {threshold}x')
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the BloodLink service layer on synthetic data')
+    parser.add_argument('--scale', default='10k', help="records in total: 1k, 10k, 100k, 1M or a number")
+    parser.add_argument('--repeat', type=int, default=20, help='calls per read/write case')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--backend', choices=['memory', 'sqlite'], default='memory')
+    parser.add_argument('--no-forecast', action='store_true', help='skip predict_blood_demand')
+    parser.add_argument('--forecast-days', type=int, default=120)
+    parser.add_argument('--forecast-departments', type=int, default=2)
+    parser.add_argument('--out', help='write the report to this .json or .csv file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two saved reports')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio that counts as a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5, help='ignore slowdowns smaller than this')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        rows = compare_reports(load_report(args.compare[0]), load_report(args.compare[1]),
+                               args.threshold, args.min_delta_ms)
+        return 1 if print_comparison(rows, args.threshold) else 0
+
+    report = run_suite(args.scale, args.repeat, args.seed, args.backend, forecast=not args.no_forecast,
+                       forecast_days=args.forecast_days, forecast_departments=args.forecast_departments)
+    print_report(report)
+    if args.out:
+        write_report(report, args.out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,11 @@
 from firebase_admin import auth
 from firebase.firebase_config import get_db
+from firebase.user_cache import get_user, invalidate_user
+from metrics import instrument
 from datetime import datetime
 
 
+@instrument
 def create_user(email, password, name, age, sex, blood_type):
     """Create user in Firebase Auth + Realtime Database"""
     try:
@@ -30,6 +33,7 @@ def create_user(email, password, name, age, sex, blood_type):
         }
 
         db.child("users").child(user.uid).set(user_data)
+        invalidate_user(user.uid)
 
         verification_link = auth.generate_email_verification_link(email)
 
@@ -43,13 +47,13 @@ def create_user(email, password, name, age, sex, blood_type):
         return {"success": False, "error": str(e)}
 
 
+@instrument
 def verify_user_password(email, password):
     """Simplified demo verification"""
     try:
         user = auth.get_user_by_email(email)
 
-        db = get_db()
-        user_data = db.child("users").child(user.uid).get()
+        user_data = get_user(user.uid)
 
         if not user_data:
             return {"success": False, "error": "User data not found"}
@@ -65,11 +69,11 @@ def verify_user_password(email, password):
         return {"success": False, "error": str(e)}
 
 
+@instrument
 def get_user_data(uid):
     """Get user data from Realtime Database"""
     try:
-        db = get_db()
-        user_data = db.child("users").child(uid).get()
+        user_data = get_user(uid)
 
         if user_data:
             return {"success": True, "data": user_data}
@@ -0,0 +1,464 @@
+"""Local stand-ins for the Realtime Database reference API.
+
+Only the subset the services use is implemented: child/get/set/update/delete,
+transaction, ordered queries, listen and the increment server value. Both backends hand out ``Reference``
+objects so service code cannot tell them apart from ``firebase_admin.db.Reference``.
+Listeners only see writes made through the same process.
+"""
+import copy
+import json
+import sqlite3
+import threading
+
+
+def _split(path):
+    return [p for p in str(path).split('/') if p]
+
+
+def _normalize(value):
+    """Drop None children and empty objects the way the RTDB does"""
+    if isinstance(value, (list, tuple)):
+        value = {str(i): v for i, v in enumerate(value)}
+    if isinstance(value, dict):
+        result = {}
+        for k, v in value.items():
+            v = _normalize(v)
+            if v is not None:
+                result[str(k)] = v
+        return result or None
+    return value
+
+
+def _shallow(value):
+    if isinstance(value, dict):
+        return {k: True if isinstance(v, dict) else v for k, v in value.items()}
+    return value
+
+
+def _sort_key(value):
+    """RTDB ordering: null, false, true, numbers, strings, objects"""
+    if value is None:
+        return (0, 0)
+    if value is False:
+        return (1, 0)
+    if value is True:
+        return (2, 0)
+    if isinstance(value, (int, float)):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, 0)
+
+
+def _is_increment(value):
+    return (isinstance(value, dict) and set(value) == {'.sv'} and isinstance(value['.sv'], dict)
+            and set(value['.sv']) == {'increment'})
+
+
+def _resolve_writes(writes, read):
+    """Replace {'.sv': {'increment': n}} values with the stored number plus n, as the RTDB does"""
+    resolved = []
+    for segments, value in writes:
+        if _is_increment(value):
+            current = read(segments)
+            if not isinstance(current, (int, float)) or isinstance(current, bool):
+                current = 0
+            value = current + value['.sv']['increment']
+        resolved.append((segments, value))
+    return resolved
+
+
+def _key_sort_key(key):
+    """Keys that look like 32-bit integers sort numerically before the rest"""
+    try:
+        number = int(key)
+        if str(number) == key and -2 ** 31 <= number < 2 ** 31:
+            return (0, number, '')
+    except ValueError:
+        pass
+    return (1, 0, key)
+
+
+class Event:
+    """A change notification, shaped like firebase_admin.db.Event"""
+
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class ListenerRegistration:
+    def __init__(self, store, segments, callback):
+        self._store = store
+        self.segments = segments
+        self.callback = callback
+        self._closed = False
+
+    def is_alive(self):
+        return not self._closed
+
+    def close(self):
+        self._closed = True
+        self._store.remove_listener(self)
+
+
+class _ListenerMixin:
+    """Fan writes out to listeners registered on an enclosing or enclosed path"""
+
+    def _init_listeners(self):
+        self._listeners = []
+
+    def add_listener(self, segments, callback):
+        registration = ListenerRegistration(self, segments, callback)
+        with self._lock:
+            self._listeners.append(registration)
+            initial = self.read(segments)
+        callback(Event('put', '/', initial))
+        return registration
+
+    def remove_listener(self, registration):
+        with self._lock:
+            if registration in self._listeners:
+                self._listeners.remove(registration)
+
+    def _notify(self, writes):
+        # Called after the lock is released so callbacks may read the store
+        for registration in list(self._listeners):
+            listen_at = registration.segments
+            for segments, value in writes:
+                if segments[:len(listen_at)] == listen_at:
+                    rel = segments[len(listen_at):]
+                    event = Event('put', '/' + '/'.join(rel), _normalize(copy.deepcopy(value)))
+                elif listen_at[:len(segments)] == segments:
+                    event = Event('put', '/', self.read(listen_at))
+                else:
+                    continue
+                registration.callback(event)
+
+
+class Reference:
+    """A location in a local store, mirroring firebase_admin.db.Reference"""
+
+    def __init__(self, store, path=()):
+        self._store = store
+        self._segments = tuple(path)
+
+    @property
+    def key(self):
+        return self._segments[-1] if self._segments else None
+
+    @property
+    def path(self):
+        return '/' + '/'.join(self._segments)
+
+    @property
+    def parent(self):
+        if not self._segments:
+            return None
+        return Reference(self._store, self._segments[:-1])
+
+    def child(self, path):
+        segments = _split(path)
+        if not segments:
+            raise ValueError('Invalid path argument: "{0}".'.format(path))
+        return Reference(self._store, self._segments + tuple(segments))
+
+    def get(self, shallow=False):
+        if shallow:
+            return self._store.read_shallow(self._segments)
+        return self._store.read(self._segments)
+
+    def set(self, value):
+        if value is None:
+            raise ValueError('Value must not be None.')
+        self._store.write_many([(self._segments, value)])
+
+    def update(self, value):
+        if not value or not isinstance(value, dict):
+            raise ValueError('Value argument must be a non-empty dictionary.')
+        writes = [(self._segments + tuple(_split(k)), v) for k, v in value.items()]
+        self._store.write_many(writes)
+
+    def delete(self):
+        self._store.write_many([(self._segments, None)])
+
+    def transaction(self, transaction_update):
+        if not callable(transaction_update):
+            raise ValueError('transaction_update must be a function.')
+        return self._store.transaction(self._segments, transaction_update)
+
+    def listen(self, callback):
+        return self._store.add_listener(self._segments, callback)
+
+    def order_by_child(self, path):
+        return Query(self, 'child', _split(path))
+
+    def order_by_key(self):
+        return Query(self, 'key')
+
+    def order_by_value(self):
+        return Query(self, 'value')
+
+
+class Query:
+    """Ordered, filtered read of the children of a Reference"""
+
+    def __init__(self, ref, order_by, child_path=None):
+        self._ref = ref
+        self._order_by = order_by
+        self._child_path = child_path or []
+        self._start = None
+        self._end = None
+        self._limit_first = None
+        self._limit_last = None
+
+    def start_at(self, start):
+        self._start = start
+        return self
+
+    def end_at(self, end):
+        self._end = end
+        return self
+
+    def equal_to(self, value):
+        self._start = value
+        self._end = value
+        return self
+
+    def limit_to_first(self, limit):
+        self._limit_first = limit
+        return self
+
+    def limit_to_last(self, limit):
+        self._limit_last = limit
+        return self
+
+    def _ordered_value(self, key, value):
+        if self._order_by == 'key':
+            return key
+        if self._order_by == 'value':
+            return value
+        for segment in self._child_path:
+            value = value.get(segment) if isinstance(value, dict) else None
+        return value
+
+    def _compare_key(self, key, value):
+        if self._order_by == 'key':
+            return _key_sort_key(key)
+        return (_sort_key(self._ordered_value(key, value)), _key_sort_key(key))
+
+    def _bound_key(self, bound):
+        if self._order_by == 'key':
+            return _key_sort_key(str(bound))
+        return (_sort_key(bound),)
+
+    def get(self):
+        # Filter the stored children in place and copy only the selected ones
+        return self._ref._store.select(self._ref._segments, self._select)
+
+    def _select(self, children):
+        if not isinstance(children, dict):
+            return {}
+
+        items = sorted(children.items(), key=lambda kv: self._compare_key(*kv))
+
+        if self._start is not None:
+            lower = self._bound_key(self._start)
+            items = [kv for kv in items if self._compare_key(*kv)[:len(lower)] >= lower]
+        if self._end is not None:
+            upper = self._bound_key(self._end)
+            items = [kv for kv in items if self._compare_key(*kv)[:len(upper)] <= upper]
+        if self._limit_first is not None:
+            items = items[:self._limit_first]
+        if self._limit_last is not None:
+            items = items[-self._limit_last:] if self._limit_last else []
+
+        return dict(items)
+
+
+class MemoryStore(_ListenerMixin):
+    """Process-local tree of nested dicts"""
+
+    def __init__(self):
+        self._root = None
+        self._lock = threading.RLock()
+        self._init_listeners()
+
+    def _node(self, segments):
+        node = self._root
+        for segment in segments:
+            if not isinstance(node, dict):
+                return None
+            node = node.get(segment)
+        return node
+
+    def _write(self, segments, value):
+        value = _normalize(copy.deepcopy(value))
+        if not segments:
+            self._root = value
+            return
+
+        if not isinstance(self._root, dict):
+            if value is None:
+                return
+            self._root = {}
+
+        parents = [self._root]
+        node = self._root
+        for segment in segments[:-1]:
+            child = node.get(segment)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[segment] = {}
+            node = child
+            parents.append(node)
+
+        if value is None:
+            node.pop(segments[-1], None)
+            # Prune objects left empty by the delete
+            for depth in range(len(parents) - 1, 0, -1):
+                if parents[depth]:
+                    break
+                parents[depth - 1].pop(segments[depth - 1], None)
+            if not self._root:
+                self._root = None
+        else:
+            node[segments[-1]] = value
+
+    def read(self, segments):
+        with self._lock:
+            return copy.deepcopy(self._node(segments))
+
+    def read_shallow(self, segments):
+        with self._lock:
+            return _shallow(self._node(segments))
+
+    def select(self, segments, select):
+        with self._lock:
+            return copy.deepcopy(select(self._node(segments)))
+
+    def write_many(self, writes):
+        with self._lock:
+            writes = _resolve_writes(writes, self._node)
+            for segments, value in writes:
+                self._write(segments, value)
+        self._notify(writes)
+
+    def transaction(self, segments, transaction_update):
+        with self._lock:
+            new_value = transaction_update(copy.deepcopy(self._node(segments)))
+            self._write(segments, new_value)
+        self._notify([(segments, new_value)])
+        return new_value
+
+
+class SQLiteStore(_ListenerMixin):
+    """Tree stored as one row per leaf, keyed by its slash-separated path"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS nodes (path TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self._lock = threading.RLock()
+        self._init_listeners()
+
+    @staticmethod
+    def _subtree_clause(prefix):
+        # '0' is the character after '/', so the range covers every descendant
+        if not prefix:
+            return '1 = 1', ()
+        return 'path = ? OR (path >= ? AND path < ?)', (prefix, prefix + '/', prefix + '0')
+
+    def _rows(self, segments):
+        prefix = '/'.join(segments)
+        clause, params = self._subtree_clause(prefix)
+        rows = self._conn.execute(f'SELECT path, value FROM nodes WHERE {clause}', params).fetchall()
+        return prefix, rows
+
+    def _read(self, segments):
+        prefix, rows = self._rows(segments)
+        result = None
+        for path, raw in rows:
+            value = json.loads(raw)
+            rel = _split(path[len(prefix):])
+            if not rel:
+                return value
+            if result is None:
+                result = {}
+            node = result
+            for segment in rel[:-1]:
+                node = node.setdefault(segment, {})
+            node[rel[-1]] = value
+        return result
+
+    def _write(self, segments, value):
+        prefix = '/'.join(segments)
+        clause, params = self._subtree_clause(prefix)
+        self._conn.execute(f'DELETE FROM nodes WHERE {clause}', params)
+
+        # A leaf stored at an ancestor path would shadow the new subtree
+        ancestors = ['/'.join(segments[:i]) for i in range(1, len(segments))]
+        if ancestors:
+            marks = ','.join('?' * len(ancestors))
+            self._conn.execute(f'DELETE FROM nodes WHERE path IN ({marks})', ancestors)
+
+        rows = []
+
+        def flatten(path, node):
+            if isinstance(node, dict):
+                for k, v in node.items():
+                    flatten(f'{path}/{k}' if path else k, v)
+            else:
+                rows.append((path, json.dumps(node)))
+
+        value = _normalize(value)
+        if value is not None:
+            flatten(prefix, value)
+            self._conn.executemany('INSERT INTO nodes (path, value) VALUES (?, ?)', rows)
+
+    def read(self, segments):
+        with self._lock:
+            return self._read(segments)
+
+    def read_shallow(self, segments):
+        return _shallow(self.read(segments))
+
+    def select(self, segments, select):
+        return select(self.read(segments))
+
+    def write_many(self, writes):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                writes = _resolve_writes(writes, self._read)
+                for segments, value in writes:
+                    self._write(segments, value)
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+        self._notify(writes)
+
+    def transaction(self, segments, transaction_update):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                new_value = transaction_update(self._read(segments))
+                self._write(segments, new_value)
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+        self._notify([(segments, new_value)])
+        return new_value
+
+
+def open_backend(name, sqlite_path='bloodlink.db'):
+    """Root Reference of a local backend: 'memory' or 'sqlite'"""
+    if name == 'memory':
+        return Reference(MemoryStore())
+    if name == 'sqlite':
+        return Reference(SQLiteStore(sqlite_path))
+    raise ValueError(f'Unknown database backend: {name}')
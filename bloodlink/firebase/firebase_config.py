@@ -1,12 +1,22 @@
 import firebase_admin
 from firebase_admin import credentials, auth, db
+from firebase import backends
 import os
 
+# 'firebase' (hosted RTDB), 'memory' or 'sqlite' for local profiling and load tests
+DB_BACKEND = os.environ.get('BLOODLINK_DB_BACKEND', 'firebase')
+SQLITE_PATH = os.environ.get('BLOODLINK_SQLITE_PATH', 'bloodlink.db')
+
 database = None
 
 def initialize_firebase():
     global database
 
+    if DB_BACKEND != 'firebase':
+        database = backends.open_backend(DB_BACKEND, SQLITE_PATH)
+        print(f"Using local {DB_BACKEND} database backend")
+        return database
+
     try:
         firebase_admin.get_app()
     except ValueError:
@@ -33,3 +43,10 @@ def get_db():
     if database is None:
         database = initialize_firebase()
     return database
+
+
+def use_backend(name, sqlite_path=SQLITE_PATH):
+    """Switch the process to a local backend at runtime (benchmarks, load tests)"""
+    global database
+    database = backends.open_backend(name, sqlite_path)
+    return database
@@ -1,11 +1,344 @@
 from firebase.firebase_config import get_db
-from datetime import datetime
+from firebase.user_cache import get_users, invalidate_user
+from firebase.loader import fetch_records, read
+from firebase.request_mirror import active_mirror
+from firebase import geo
+from metrics import instrument
+from collections import defaultdict
+from datetime import datetime, timedelta
+import base64
+import json
+import os
+import random
 import uuid
 
+# Closed records move to archive/<node>/<yyyy-mm>/ after this many days
+ARCHIVE_AFTER_DAYS = int(os.environ.get('BLOODLINK_ARCHIVE_AFTER_DAYS', 30))
+# Pending requests expire this many days after they were created
+REQUEST_EXPIRY_DAYS = int(os.environ.get('BLOODLINK_REQUEST_EXPIRY_DAYS', 30))
+# Pending donations expire this many days after their donation_date
+DONATION_GRACE_DAYS = int(os.environ.get('BLOODLINK_DONATION_GRACE_DAYS', 1))
+# Records moved per multi-path update
+ARCHIVE_BATCH = 500
+# Seconds a verification holds its claim on a slot before another attempt may take it over
+VERIFY_CLAIM_SECONDS = 60
+CREDITS_PER_DONATION = 100
+
+CLOSED_REQUEST_STATUSES = ('fulfilled', 'expired')
+CLOSED_DONATION_STATUSES = ('completed', 'expired')
+
 def now():
     return datetime.utcnow().isoformat()
 
 
+class _TransactionAbort(Exception):
+    """Raised inside a transaction function to abort it with a user-facing error"""
+
+
+def _increment(amount):
+    """Server value adding amount to the stored number, usable inside multi-path updates"""
+    return {'.sv': {'increment': amount}}
+
+
+def _new_code(taken):
+    """4-digit verification code not already held by another donor on the request"""
+    while True:
+        code = str(random.randint(1000, 9999))
+        if code not in taken:
+            return code
+
+
+def _claim_slot(donor_uid, donation_id):
+    """Transaction function: take one slot on a blood request for donor_uid.
+
+    The slot's verification code is kept on the donor entry, unique within the
+    request, so verify_donation finds it in the record its transaction reads.
+    """
+    def update(request):
+        if not request:
+            raise _TransactionAbort('Request not found')
+
+        donors = request.get('donors') or {}
+        if donor_uid in donors:
+            raise _TransactionAbort('You already accepted this request')
+
+        units = request.get('units', 0)
+        filled = request.get('slots_filled', 0)
+        if filled >= units:
+            raise _TransactionAbort('All slots filled')
+
+        code = _new_code({d.get('verification_code') for d in donors.values()})
+        donors[donor_uid] = {'donation_id': donation_id, 'status': 'pending', 'verification_code': code}
+        request['donors'] = donors
+        request['slots_filled'] = filled + 1
+        request['slots_available'] = units - filled - 1
+        if request['slots_available'] <= 0:
+            request['status'] = 'all_slots_filled'
+        return request
+
+    return update
+
+
+def _release_slot(donor_uid):
+    """Transaction function: give donor_uid's slot back and reopen the request"""
+    def update(request):
+        if not request:
+            return request
+
+        donors = request.get('donors') or {}
+        donors.pop(donor_uid, None)
+        request['donors'] = donors
+
+        filled = max(request.get('slots_filled', 0) - 1, 0)
+        request['slots_filled'] = filled
+        request['slots_available'] = request.get('units', 0) - filled
+        request['status'] = 'pending'
+        return request
+
+    return update
+
+
+def _claim_verification(verification_code, claim, claimed_at, stale_before):
+    """Transaction function: claim the slot holding verification_code for one verification.
+
+    The claim keeps concurrent verifications of the same code out until the
+    claimant writes the slot completed. A claim older than stale_before is one
+    whose writes failed, and may be taken over.
+    """
+    def update(request):
+        if not request:
+            raise _TransactionAbort('Request not found')
+
+        donors = request.get('donors') or {}
+        entry = next((d for d in donors.values() if d.get('verification_code') == verification_code), None)
+        if entry is None:
+            raise _TransactionAbort('Invalid verification code')
+        if entry.get('status') == 'completed':
+            raise _TransactionAbort('Already verified')
+        if (entry.get('claimed_at') or '') >= stale_before:
+            raise _TransactionAbort('Verification already in progress')
+
+        entry['claim'] = claim
+        entry['claimed_at'] = claimed_at
+        return request
+
+    return update
+
+
+def _expire_request(expired_at):
+    """Transaction function: close a pending request nobody is still scheduled to donate to"""
+    def update(request):
+        if not request or request.get('status') != 'pending':
+            raise _TransactionAbort('Request is not pending')
+        if any(d.get('status') == 'pending' for d in (request.get('donors') or {}).values()):
+            raise _TransactionAbort('Request has scheduled donations')
+
+        request['status'] = 'expired'
+        request['expired_at'] = expired_at
+        return request
+
+    return update
+
+
+@instrument
+def get_child_keys(path):
+    """Keys directly under path, via a shallow read that never downloads the children"""
+    return list((read(get_db().child(path), f'shallow:{path.split("/")[0]}', shallow=True) or {}).keys())
+
+
+@instrument
+def count_children(path):
+    return len(get_child_keys(path))
+
+
+@instrument
+def count_request_donations(request_id):
+    return count_children(f'donations_by_request/{request_id}')
+
+
+@instrument
+def get_user_request_ids(uid):
+    return get_child_keys(f'requests_by_requester/{uid}')
+
+
+@instrument
+def get_request_status(request_id):
+    """Just blood_requests/<id>/status rather than the whole record"""
+    return read(get_db().child('blood_requests').child(request_id).child('status'), 'blood_requests/*/status')
+
+
+def _archive_month(created_at):
+    return (created_at or '')[:7] or 'undated'
+
+
+def _archive_path(node, record_id, created_at):
+    """archive/<node>/<yyyy-mm>/<id>, partitioned by the timestamp the index nodes store as values"""
+    return f'archive/{node}/{_archive_month(created_at)}/{record_id}'
+
+
+def _fetch_with_archive(node, index):
+    """fetch_records for {id: created timestamp} index entries, looking in the archive for ids no longer in node"""
+    records = fetch_records(node, index)
+
+    missing = defaultdict(list)
+    for record_id, created_at in index.items():
+        if record_id not in records:
+            missing[_archive_month(created_at)].append(record_id)
+    for month, ids in missing.items():
+        records.update(fetch_records(f'archive/{node}/{month}', ids, label=f'archive/{node}/*/*'))
+
+    return records
+
+
+def _get_indexed_donations(db, index_node, key):
+    """Load the donations listed under an index node such as donations_by_request/<id>, archived ones included"""
+    index = read(db.child(index_node).child(key), f'{index_node}/*') or {}
+    return _fetch_with_archive('donations', index)
+
+
+def _encode_cursor(sort_value, key):
+    raw = json.dumps([sort_value, key]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_cursor(cursor):
+    sort_value, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return sort_value, key
+
+
+def _paginate(items, limit=None, cursor=None):
+    """Page a list of (sort_value, key, record) sorted by (sort_value, key)"""
+    if cursor:
+        after = _decode_cursor(cursor)
+        items = [item for item in items if (item[0], item[1]) > after]
+    if not limit:
+        return items, None
+
+    page = items[:limit]
+    next_cursor = _encode_cursor(page[-1][0], page[-1][1]) if len(items) > limit else None
+    return page, next_cursor
+
+
+def _query_page(ref, limit, cursor=None, child=None):
+    """One page of ref's children ordered by a child value, or by the value itself when child is None.
+
+    Uses start_at/limit_to_first so only about one page is read per call. The
+    ordered node needs an .indexOn rule for the child (or ".value") on Firebase.
+    """
+    after = _decode_cursor(cursor) if cursor else None
+    start = after[0] if after else None
+    batch = limit + 1
+    page = []
+
+    while True:
+        query = ref.order_by_child(child) if child else ref.order_by_value()
+        if start is not None:
+            query = query.start_at(start)
+        chunk = query.limit_to_first(batch).get() or {}
+
+        progressed = False
+        for key, value in chunk.items():
+            sort_value = (value.get(child) if child else value) or ''
+            if after and (sort_value, key) <= after:
+                continue
+            progressed = True
+            after = (sort_value, key)
+            page.append((sort_value, key, value))
+            if len(page) > limit:
+                return page[:limit], _encode_cursor(page[limit - 1][0], page[limit - 1][1])
+
+        if len(chunk) < batch:
+            return page, None
+        if progressed:
+            start = after[0]
+        else:
+            # A run of equal sort values longer than the batch; widen it
+            batch *= 2
+
+
+def _slots_available(request):
+    filled = request.get('slots_filled', 0)
+    return request.get('slots_available', request.get('units', 0) - filled)
+
+
+def _is_listable(request):
+    return request.get('status') == 'pending' and _slots_available(request) > 0
+
+
+def _request_entry(rid, r):
+    """Request as shown to users: the donor map holds the slots' verification codes, which stay server-side"""
+    r.pop('donors', None)
+    r['id'] = rid
+    return r
+
+
+def _listing_entry(rid, r, distance=None):
+    _request_entry(rid, r)
+    r['slots_filled'] = r.get('slots_filled', 0)
+    r['slots_available'] = _slots_available(r)
+    if distance is not None:
+        r['distance_km'] = distance
+    return r
+
+
+def _coordinates(location):
+    """(latitude, longitude) as floats, or None when location has no usable coordinates"""
+    if not isinstance(location, dict):
+        return None
+    try:
+        lat, lng = float(location.get('latitude')), float(location.get('longitude'))
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+def _geo_key(request_id, location):
+    """Key of a request in pending_geo: geohash first so prefix ranges select a cell"""
+    coordinates = _coordinates(location)
+    if not coordinates:
+        return None
+    cell = geo.encode(*coordinates)
+    return f'{cell}:{request_id}'
+
+
+def _geo_entry(request_id, location):
+    lat, lng = _coordinates(location)
+    return {
+        'request_id': request_id,
+        'latitude': lat,
+        'longitude': lng
+    }
+
+
+def _pending_update(request_id, request, pending):
+    """Multi-path update fragment adding or removing a request from the pending indexes.
+
+    open_requests maps id -> created_at and pages the unfiltered listing;
+    pending_geo serves the nearby listing.
+    """
+    update = {f'open_requests/{request_id}': (request.get('created_at') or '') if pending else None}
+    key = _geo_key(request_id, request.get('location'))
+    if key:
+        update[f'pending_geo/{key}'] = _geo_entry(request_id, request['location']) if pending else None
+    return update
+
+
+def _nearby_request_ids(db, latitude, longitude, max_distance_km):
+    """Request ids within max_distance_km, read from the neighbouring geohash cells only"""
+    distances = {}
+    for cell in geo.covering_cells(latitude, longitude, max_distance_km):
+        entries = db.child('pending_geo').order_by_key().start_at(cell).end_at(cell + '~').get() or {}
+        for entry in entries.values():
+            distance = geo.haversine_km(latitude, longitude, entry['latitude'], entry['longitude'])
+            if distance <= max_distance_km:
+                distances[entry['request_id']] = distance
+
+    return sorted(distances.items(), key=lambda item: item[1])
+
+
+@instrument
 def create_blood_request(uid, blood_type, units, location, special_requirements=''):
     """Create a new blood request"""
     try:
@@ -19,19 +352,22 @@ def create_blood_request(uid, blood_type, units, location, special_requirements=
             'location': location,
             'special_requirements': special_requirements,
             'status': 'pending',
+            'slots_filled': 0,
+            'slots_available': int(units),
             'created_at': now(),
             'fulfilled_by': None,
             'fulfilled_at': None
         }
 
-        db.child('blood_requests').child(request_id).set(request_data)
+        db.update({
+            f'blood_requests/{request_id}': request_data,
+            f'requests_by_requester/{uid}/{request_id}': request_data['created_at'],
+            **_pending_update(request_id, request_data, pending=True)
+        })
 
         # Update user request count
-        user_ref = db.child('users').child(uid)
-        user = user_ref.get() or {}
-        user_ref.update({
-            'requests': user.get('requests', 0) + 1
-        })
+        db.child('users').child(uid).child('requests').transaction(lambda count: (count or 0) + 1)
+        invalidate_user(uid)
 
         return {'success': True, 'request_id': request_id}
 
@@ -39,63 +375,83 @@ def create_blood_request(uid, blood_type, units, location, special_requirements=
         return {'success': False, 'error': str(e)}
 
 
-def get_pending_requests(user_location=None, max_distance_km=50):
-    """Get all pending blood requests with slot availability"""
+@instrument
+def get_pending_requests(user_location=None, max_distance_km=50, limit=None, cursor=None):
+    """Get pending blood requests with slot availability, nearest first when a location is given.
+
+    Oldest first otherwise. Pass limit (and the returned next_cursor) to page through the results.
+    """
     try:
         db = get_db()
-        requests = db.child('blood_requests').get() or {}
-        donations = db.child('donations').get() or {}
-
-        result = []
-
+        mirror = active_mirror()
+        distances = {}
+        # A location without usable coordinates lists every pending request, as before the distance filter
+        origin = _coordinates(user_location)
+
+        if mirror:
+            # Served from the in-process replica; no database reads at all
+            requests = mirror.open_requests()
+            if origin:
+                for rid, r in requests.items():
+                    coordinates = _coordinates(r.get('location'))
+                    if not coordinates:
+                        continue
+                    distance = geo.haversine_km(*origin, *coordinates)
+                    if distance <= max_distance_km:
+                        distances[rid] = round(distance, 1)
+                nearest = sorted(distances, key=distances.get)
+                requests = {rid: requests[rid] for rid in nearest}
+        elif origin:
+            nearby = _nearby_request_ids(db, *origin, max_distance_km)
+
+            found = fetch_records('blood_requests', [rid for rid, _ in nearby])
+            requests = {rid: found[rid] for rid, _ in nearby if rid in found}
+            distances = {rid: round(distance, 1) for rid, distance in nearby}
+        elif limit:
+            # One bounded query over the open_requests index, then only that page's records
+            page, next_cursor = _query_page(db.child('open_requests'), limit, cursor)
+            found = fetch_records('blood_requests', [rid for _, rid, _ in page])
+            result = [_listing_entry(rid, found[rid]) for _, rid, _ in page
+                      if rid in found and _is_listable(found[rid])]
+            return {'success': True, 'requests': result, 'next_cursor': next_cursor}
+        else:
+            requests = db.child('blood_requests').get() or {}
+
+        items = []
         for rid, r in requests.items():
-            if r.get('status') != 'pending':
+            if not _is_listable(r):
                 continue
+            sort_value = distances[rid] if distances else r.get('created_at') or ''
+            items.append((sort_value, rid, r))
+        items.sort(key=lambda item: (item[0], item[1]))
 
-            # Count filled slots
-            filled = sum(1 for d in donations.values() if d.get('request_id') == rid)
-            slots_available = r.get('units', 0) - filled
+        page, next_cursor = _paginate(items, limit, cursor)
+        result = [_listing_entry(rid, r, distances.get(rid)) for _, rid, r in page]
 
-            if slots_available > 0:
-                r['id'] = rid
-                r['slots_filled'] = filled
-                r['slots_available'] = slots_available
-                result.append(r)
-
-        return {'success': True, 'requests': result}
+        return {'success': True, 'requests': result, 'next_cursor': next_cursor}
 
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
 
+@instrument
 def accept_donation_slot(request_id, donor_uid, donation_date, donation_time):
     """Accept a donation slot (1 unit only)"""
     try:
         db = get_db()
+        donation_id = str(uuid.uuid4())
 
-        # Get the request
-        request = db.child('blood_requests').child(request_id).get()
-        if not request:
-            return {'success': False, 'error': 'Request not found'}
-
-        # Check existing donations
-        donations = db.child('donations').get() or {}
-        existing = [d for d in donations.values() if d.get('request_id') == request_id]
-
-        units_needed = request.get('units', 0)
-
-        if len(existing) >= units_needed:
-            return {'success': False, 'error': 'All slots filled'}
-
-        # Check if donor already accepted
-        if any(d.get('donor_uid') == donor_uid for d in existing):
-            return {'success': False, 'error': 'You already accepted this request'}
+        # Take a slot atomically: the transaction also rejects duplicate donors,
+        # so concurrent accepts can never over-allocate
+        try:
+            claim = _claim_slot(donor_uid, donation_id)
+            request = db.child('blood_requests').child(request_id).transaction(claim)
+        except _TransactionAbort as e:
+            return {'success': False, 'error': str(e)}
 
-        # Generate verification code
-        import random
-        verification_code = str(random.randint(1000, 9999))
-        donation_id = str(uuid.uuid4())
+        verification_code = request['donors'][donor_uid]['verification_code']
 
+        accepted_at = now()
         donation_data = {
             'request_id': request_id,
             'donor_uid': donor_uid,
@@ -105,128 +461,179 @@ def accept_donation_slot(request_id, donor_uid, donation_date, donation_time):
             'donation_time': donation_time,
             'verification_code': verification_code,
             'status': 'pending',
-            'accepted_at': now(),
+            'accepted_at': accepted_at,
             'verified_at': None,
             'location': request.get('location')
         }
 
-        db.child('donations').child(donation_id).set(donation_data)
-
-        # Update request status if all slots filled
-        total_accepted = len(existing) + 1
-        if total_accepted >= units_needed:
-            db.child('blood_requests').child(request_id).update({'status': 'all_slots_filled'})
+        # Write the donation and its index entries in one multi-path update,
+        # dropping the request from the pending indexes once all slots are filled
+        filled_up = request.get('status') == 'all_slots_filled'
+        db.update({
+            f'donations/{donation_id}': donation_data,
+            f'donations_by_request/{request_id}/{donation_id}': accepted_at,
+            f'donations_by_donor/{donor_uid}/{donation_id}': accepted_at,
+            **(_pending_update(request_id, request, pending=False) if filled_up else {})
+        })
 
         return {
             'success': True,
             'verification_code': verification_code,
             'donation_id': donation_id,
-            'slots_remaining': units_needed - total_accepted
+            'slots_remaining': request['slots_available']
         }
 
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
 
+@instrument
 def verify_donation(request_id, verification_code):
-    """Verify donation with 4-digit code and award credits"""
+    """Verify donation with 4-digit code and award credits.
+
+    One transaction on the request finds the slot by its code and claims it;
+    one multi-path update then completes the slot, the donation and the
+    donor's credits together, so they are written all or not at all.
+    """
     try:
         db = get_db()
-        donations = db.child('donations').get() or {}
+        claim = uuid.uuid4().hex
+        verified_at = now()
+        stale_before = (datetime.utcnow() - timedelta(seconds=VERIFY_CLAIM_SECONDS)).isoformat()
+
+        try:
+            claim_slot = _claim_verification(verification_code, claim, verified_at, stale_before)
+            request = db.child('blood_requests').child(request_id).transaction(claim_slot)
+        except _TransactionAbort as e:
+            return {'success': False, 'error': str(e)}
+
+        donors = request['donors']
+        donor_uid = next(uid for uid, d in donors.items() if d.get('claim') == claim)
+        donation_id = donors[donor_uid]['donation_id']
+
+        # Slots other verifications are still writing count as done, so two
+        # concurrent last verifications cannot both leave the request open
+        fulfilled = all(d.get('status') == 'completed' or (d.get('claimed_at') or '') >= stale_before
+                        for uid, d in donors.items() if uid != donor_uid)
+
+        updates = {
+            f'blood_requests/{request_id}/donors/{donor_uid}': {
+                'donation_id': donation_id,
+                'status': 'completed',
+                'verification_code': verification_code
+            },
+            f'donations/{donation_id}/status': 'completed',
+            f'donations/{donation_id}/verified_at': verified_at,
+            f'users/{donor_uid}/blood_credits': _increment(CREDITS_PER_DONATION),
+            f'users/{donor_uid}/donations': _increment(1)
+        }
+        if fulfilled:
+            updates[f'blood_requests/{request_id}/status'] = 'fulfilled'
+            updates[f'blood_requests/{request_id}/fulfilled_at'] = verified_at
+            updates.update(_pending_update(request_id, request, pending=False))
+        db.update(updates)
+        invalidate_user(donor_uid)
 
-        # Find matching donation
-        for did, d in donations.items():
-            if d.get('request_id') == request_id and d.get('verification_code') == verification_code:
-                if d.get('status') == 'completed':
-                    return {'success': False, 'error': 'Already verified'}
-
-                # Update donation status
-                db.child('donations').child(did).update({
-                    'status': 'completed',
-                    'verified_at': now()
-                })
+        return {'success': True, 'donor_uid': donor_uid}
 
-                # Award credits
-                donor_uid = d['donor_uid']
-                user_ref = db.child('users').child(donor_uid)
-                user = user_ref.get() or {}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
 
-                user_ref.update({
-                    'blood_credits': user.get('blood_credits', 0) + 100,
-                    'donations': user.get('donations', 0) + 1
-                })
 
-                # Check if all donations completed
-                all_donations = db.child('donations').get() or {}
-                request_donations = [v for v in all_donations.values() if v.get('request_id') == request_id]
-                all_completed = all(d.get('status') == 'completed' for d in request_donations)
+def _indexed_page(db, index_node, key, limit=None, cursor=None):
+    """Ids from an index node whose values are creation timestamps, oldest first"""
+    index_ref = db.child(index_node).child(key)
+    if limit:
+        return _query_page(index_ref, limit, cursor)
+
+    index = index_ref.get() or {}
+    items = sorted(((created or '', k, created) for k, created in index.items()), key=lambda item: (item[0], item[1]))
+    return _paginate(items, cursor=cursor)
 
-                if all_completed:
-                    db.child('blood_requests').child(request_id).update({
-                        'status': 'fulfilled',
-                        'fulfilled_at': now()
-                    })
 
-                return {'success': True, 'donor_uid': donor_uid}
+@instrument
+def get_user_requests(uid, limit=None, cursor=None):
+    """Get requests made by a user, oldest first; pass limit/cursor to page"""
+    try:
+        db = get_db()
+        page, next_cursor = _indexed_page(db, 'requests_by_requester', uid, limit, cursor)
+        requests = _fetch_with_archive('blood_requests', {rid: created for _, rid, created in page})
 
-        return {'success': False, 'error': 'Invalid verification code'}
+        result = []
+        for _, rid, _ in page:
+            if rid in requests:
+                result.append(_request_entry(rid, requests[rid]))
+
+        return {'success': True, 'requests': result, 'next_cursor': next_cursor}
 
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
 
-def get_user_requests(uid):
-    """Get all requests made by a user"""
+@instrument
+def get_user_request(uid, request_id):
+    """One request, only if uid made it; checks a single index leaf instead of listing every request.
+
+    Falls back to the archive partition named by the index entry.
+    """
     try:
         db = get_db()
-        requests = db.child('blood_requests').get() or {}
+        created_at = read(db.child('requests_by_requester').child(uid).child(request_id), 'requests_by_requester/*/*')
+        if created_at is None:
+            return {'success': False, 'error': 'Request not found'}
 
-        result = []
-        for rid, r in requests.items():
-            if r.get('requester_uid') == uid:
-                r['id'] = rid
-                result.append(r)
+        r = read(db.child('blood_requests').child(request_id), 'blood_requests/*')
+        if not r:
+            r = read(db.child(_archive_path('blood_requests', request_id, created_at)), 'archive/blood_requests/*/*')
+        if not r:
+            return {'success': False, 'error': 'Request not found'}
 
-        return {'success': True, 'requests': result}
+        return {'success': True, 'request': _request_entry(request_id, r)}
 
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
 
-def get_user_donations(uid):
-    """Get all donations made by a user"""
+@instrument
+def get_user_donations(uid, limit=None, cursor=None):
+    """Get donations made by a user, oldest first; pass limit/cursor to page"""
     try:
         db = get_db()
-        donations = db.child('donations').get() or {}
+        page, next_cursor = _indexed_page(db, 'donations_by_donor', uid, limit, cursor)
+        donations = _fetch_with_archive('donations', {did: accepted for _, did, accepted in page})
 
         result = []
-        for did, d in donations.items():
-            if d.get('donor_uid') == uid:
+        for _, did, _ in page:
+            if did in donations:
+                d = donations[did]
                 d['id'] = did
                 result.append(d)
 
-        return {'success': True, 'donations': result}
+        return {'success': True, 'donations': result, 'next_cursor': next_cursor}
 
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
 
+@instrument
 def get_request_donations(request_id):
-    """Get all donations for a specific request"""
+    """Get all donations for a specific request, without the donors' verification codes"""
     try:
         db = get_db()
-        donations = db.child('donations').get() or {}
+        donations = _get_indexed_donations(db, 'donations_by_request', request_id)
+
+        # Resolve every donor name in one batch
+        donors = get_users(d.get('donor_uid') for d in donations.values())
 
         result = []
         for donation_id, d in donations.items():
-            if d.get('request_id') == request_id:
-                d['id'] = donation_id
+            d.pop('verification_code', None)
+            d['id'] = donation_id
 
-                # Get donor name
-                donor = db.child('users').child(d['donor_uid']).get()
-                d['donor_name'] = donor.get('name', 'Anonymous') if donor else 'Anonymous'
+            donor = donors.get(d.get('donor_uid'))
+            d['donor_name'] = donor.get('name', 'Anonymous') if donor else 'Anonymous'
 
-                result.append(d)
+            result.append(d)
 
         return {'success': True, 'donations': result}
 
@@ -234,6 +641,7 @@ def get_request_donations(request_id):
         return {'success': False, 'error': str(e)}
 
 
+@instrument
 def update_user_location(uid, latitude, longitude, address):
     """Update user's location"""
     try:
@@ -246,6 +654,7 @@ def update_user_location(uid, latitude, longitude, address):
                 'updated_at': now()
             }
         })
+        invalidate_user(uid)
 
         return {'success': True}
 
@@ -253,6 +662,7 @@ def update_user_location(uid, latitude, longitude, address):
         return {'success': False, 'error': str(e)}
 
 
+@instrument
 def create_hospital_request(hospital_name, location, blood_type, units, urgency='normal'):
     """Create a blood request from a hospital"""
     try:
@@ -266,11 +676,16 @@ def create_hospital_request(hospital_name, location, blood_type, units, urgency=
             'location': location,
             'urgency': urgency,
             'status': 'pending',
+            'slots_filled': 0,
+            'slots_available': int(units),
             'type': 'hospital',
             'created_at': now()
         }
 
-        db.child('blood_requests').child(request_id).set(request_data)
+        db.update({
+            f'blood_requests/{request_id}': request_data,
+            **_pending_update(request_id, request_data, pending=True)
+        })
 
         return {'success': True, 'request_id': request_id}
 
@@ -278,6 +693,7 @@ def create_hospital_request(hospital_name, location, blood_type, units, urgency=
         return {'success': False, 'error': str(e)}
 
 
+@instrument
 def delete_user_donation(donation_id, uid):
     """Delete a donation (only if pending)"""
     try:
@@ -297,15 +713,253 @@ def delete_user_donation(donation_id, uid):
         if donation.get('status') != 'pending':
             return {'success': False, 'error': 'Cannot delete completed donations'}
         
-        # Delete the donation
-        db.child('donations').child(donation_id).delete()
-        
-        # Update request status back to pending if needed
+        # Give the slot back and reopen the request
         request_id = donation.get('request_id')
+        request = None
+        if request_id:
+            request = db.child('blood_requests').child(request_id).transaction(_release_slot(uid))
+        
+        # Delete the donation together with its index entries
+        removal = {
+            f'donations/{donation_id}': None,
+            f'donations_by_donor/{uid}/{donation_id}': None
+        }
         if request_id:
-            db.child('blood_requests').child(request_id).update({'status': 'pending'})
+            removal[f'donations_by_request/{request_id}/{donation_id}'] = None
+        if request:
+            removal.update(_pending_update(request_id, request, pending=True))
+        db.update(removal)
         
         return {'success': True}
     
     except Exception as e:
-        return {'success': False, 'error': str(e)}
\ No newline at end of file
+        return {'success': False, 'error': str(e)}
+
+
+@instrument
+def backfill_donation_indexes():
+    """One-off: build donations_by_request, donations_by_donor and request donor maps (with codes) from existing donations"""
+    try:
+        db = get_db()
+        donations = db.child('donations').get() or {}
+
+        updates = {}
+        for did, d in donations.items():
+            accepted_at = d.get('accepted_at') or now()
+            if d.get('request_id'):
+                updates[f"donations_by_request/{d['request_id']}/{did}"] = accepted_at
+            if d.get('donor_uid'):
+                updates[f"donations_by_donor/{d['donor_uid']}/{did}"] = accepted_at
+            if d.get('request_id') and d.get('donor_uid'):
+                updates[f"blood_requests/{d['request_id']}/donors/{d['donor_uid']}"] = {
+                    'donation_id': did,
+                    'status': d.get('status', 'pending'),
+                    'verification_code': d.get('verification_code')
+                }
+
+        if updates:
+            db.update(updates)
+
+        return {'success': True, 'donations': len(donations), 'index_entries': len(updates)}
+
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+
+@instrument
+def backfill_geo_index():
+    """One-off: rebuild pending_geo from the pending blood requests"""
+    try:
+        db = get_db()
+        requests = db.child('blood_requests').get() or {}
+
+        entries = {}
+        for rid, r in requests.items():
+            key = _geo_key(rid, r.get('location'))
+            if key and r.get('status') == 'pending':
+                entries[key] = _geo_entry(rid, r['location'])
+
+        db.child('pending_geo').set(entries)
+
+        return {'success': True, 'index_entries': len(entries)}
+
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+
+@instrument
+def backfill_open_requests():
+    """One-off: rebuild open_requests from the pending blood requests"""
+    try:
+        db = get_db()
+        requests = db.child('blood_requests').order_by_child('status').equal_to('pending').get() or {}
+
+        entries = {rid: r.get('created_at') or '' for rid, r in requests.items()}
+        db.child('open_requests').set(entries)
+
+        return {'success': True, 'index_entries': len(entries)}
+
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+
+@instrument
+def reconcile_slot_counters(fix=False):
+    """Recompute slots_filled/slots_available from donations_by_request and report drift"""
+    try:
+        db = get_db()
+        requests = db.child('blood_requests').get() or {}
+        by_request = db.child('donations_by_request').get() or {}
+
+        drift = []
+        updates = {}
+        for rid, r in requests.items():
+            units = r.get('units', 0)
+            filled = len(by_request.get(rid) or {})
+            available = units - filled
+
+            if r.get('slots_filled') != filled or r.get('slots_available') != available:
+                drift.append({
+                    'request_id': rid,
+                    'stored': [r.get('slots_filled'), r.get('slots_available')],
+                    'actual': [filled, available]
+                })
+                updates[f'blood_requests/{rid}/slots_filled'] = filled
+                updates[f'blood_requests/{rid}/slots_available'] = available
+
+        if fix and updates:
+            db.update(updates)
+
+        return {'success': True, 'checked': len(requests), 'drift': drift, 'fixed': bool(fix and updates)}
+
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+
+@instrument
+def backfill_request_index():
+    """One-off: build requests_by_requester from existing blood requests"""
+    try:
+        db = get_db()
+        requests = db.child('blood_requests').get() or {}
+
+        updates = {}
+        for rid, r in requests.items():
+            if r.get('requester_uid'):
+                updates[f"requests_by_requester/{r['requester_uid']}/{rid}"] = r.get('created_at') or now()
+
+        if updates:
+            db.update(updates)
+
+        return {'success': True, 'index_entries': len(updates)}
+
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+
+@instrument
+def expire_stale_records(today=None, dry_run=False):
+    """Expire pending donations whose donation_date has passed, then pending requests past REQUEST_EXPIRY_DAYS.
+
+    An expired donation gives its slot back like delete_user_donation, but the
+    record stays (status 'expired') in the donor's history. A request only
+    expires once nobody is still scheduled to donate to it. Reads use the
+    status index (".indexOn": ["status"] on both nodes).
+    """
+    try:
+        db = get_db()
+        today = today or datetime.utcnow().date()
+        expired_at = now()
+        last_valid_date = (today - timedelta(days=DONATION_GRACE_DAYS)).isoformat()
+        created_cutoff = (datetime.combine(today, datetime.min.time()) - timedelta(days=REQUEST_EXPIRY_DAYS)).isoformat()
+
+        expired_donations = 0
+        pending = db.child('donations').order_by_child('status').equal_to('pending').get() or {}
+        for did, d in pending.items():
+            if not d.get('donation_date') or d['donation_date'] >= last_valid_date:
+                continue
+            expired_donations += 1
+            if dry_run:
+                continue
+
+            request_id = d.get('request_id')
+            request = None
+            if request_id:
+                request = db.child('blood_requests').child(request_id).transaction(_release_slot(d.get('donor_uid')))
+
+            updates = {
+                f'donations/{did}/status': 'expired',
+                f'donations/{did}/expired_at': expired_at
+            }
+            if request_id:
+                updates[f'donations_by_request/{request_id}/{did}'] = None
+            if request:
+                updates.update(_pending_update(request_id, request, pending=True))
+            db.update(updates)
+
+        expired_requests = 0
+        pending = db.child('blood_requests').order_by_child('status').equal_to('pending').get() or {}
+        for rid, r in pending.items():
+            if (r.get('created_at') or '') >= created_cutoff:
+                continue
+            if dry_run:
+                expired_requests += 1
+                continue
+
+            try:
+                request = db.child('blood_requests').child(rid).transaction(_expire_request(expired_at))
+            except _TransactionAbort:
+                continue
+            expired_requests += 1
+
+            db.update(_pending_update(rid, request, pending=False))
+
+        return {'success': True, 'expired_donations': expired_donations, 'expired_requests': expired_requests}
+
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+
+@instrument
+def archive_closed_records(older_than_days=ARCHIVE_AFTER_DAYS, dry_run=False):
+    """Move requests and donations closed for older_than_days into archive/<node>/<yyyy-mm>/<id>.
+
+    Requests are partitioned by created_at and donations by accepted_at, the
+    values their index nodes hold, so user history reads can find them again.
+    Each record is copied and removed in the same multi-path update.
+    """
+    try:
+        db = get_db()
+        cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).isoformat()
+
+        moves = []
+        for status in CLOSED_REQUEST_STATUSES:
+            found = db.child('blood_requests').order_by_child('status').equal_to(status).get() or {}
+            for rid, r in found.items():
+                closed_at = r.get('fulfilled_at') or r.get('expired_at') or r.get('created_at') or ''
+                if closed_at < cutoff:
+                    moves.append(('blood_requests', rid, r, r.get('created_at')))
+        for status in CLOSED_DONATION_STATUSES:
+            found = db.child('donations').order_by_child('status').equal_to(status).get() or {}
+            for did, d in found.items():
+                closed_at = d.get('verified_at') or d.get('expired_at') or d.get('accepted_at') or ''
+                if closed_at < cutoff:
+                    moves.append(('donations', did, d, d.get('accepted_at')))
+
+        if not dry_run:
+            for start in range(0, len(moves), ARCHIVE_BATCH):
+                updates = {}
+                for node, record_id, record, created_at in moves[start:start + ARCHIVE_BATCH]:
+                    updates[_archive_path(node, record_id, created_at)] = record
+                    updates[f'{node}/{record_id}'] = None
+                db.update(updates)
+
+        return {
+            'success': True,
+            'archived_requests': sum(1 for move in moves if move[0] == 'blood_requests'),
+            'archived_donations': sum(1 for move in moves if move[0] == 'donations'),
+            'dry_run': dry_run
+        }
+
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
@@ -0,0 +1,84 @@
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0
+
+# Precision stored in the index (~4.8m x 4.8m cells)
+INDEX_PRECISION = 9
+
+# Approximate (height_km, width_km at the equator) of a geohash cell per precision
+CELL_SIZE_KM = {
+    1: (4992.6, 5009.4),
+    2: (624.1, 1252.3),
+    3: (156.0, 156.5),
+    4: (19.5, 39.1),
+    5: (4.9, 4.9),
+    6: (0.61, 1.22),
+    7: (0.153, 0.153),
+}
+
+
+def encode(latitude, longitude, precision=INDEX_PRECISION):
+    """Encode a coordinate as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        rng, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits = bits << 1
+            rng[1] = mid
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def precision_for_radius(radius_km, latitude=0.0):
+    """Finest precision whose cells are still at least radius_km across"""
+    scale = max(math.cos(math.radians(latitude)), 0.01)
+    best = 1
+    for precision, (height, width) in sorted(CELL_SIZE_KM.items()):
+        if min(height, width * scale) >= radius_km:
+            best = precision
+    return best
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """Geohash prefixes of the cell containing the point and its 8 neighbours"""
+    precision = precision_for_radius(radius_km, latitude)
+    height, width = CELL_SIZE_KM[precision]
+    dlat = height / 111.32
+    dlon = width / 111.32
+
+    cells = set()
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            lat = min(max(latitude + i * dlat, -89.999), 89.999)
+            lon = (longitude + j * dlon + 180) % 360 - 180
+            cells.add(encode(lat, lon, precision))
+
+    return sorted(cells)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two coordinates"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
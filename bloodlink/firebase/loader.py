@@ -0,0 +1,57 @@
+from firebase.firebase_config import get_db
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+import json
+import os
+import threading
+
+LOADER_WORKERS = int(os.environ.get('BLOODLINK_LOADER_WORKERS', 8))
+
+_pool = ThreadPoolExecutor(max_workers=LOADER_WORKERS, thread_name_prefix='rtdb-loader')
+
+# Approximate JSON bytes downloaded per read label, to compare access patterns
+_transfer = defaultdict(lambda: {'reads': 0, 'bytes': 0})
+_transfer_lock = threading.Lock()
+
+
+def _record_transfer(label, value):
+    size = len(json.dumps(value, separators=(',', ':')))
+    with _transfer_lock:
+        _transfer[label]['reads'] += 1
+        _transfer[label]['bytes'] += size
+
+
+def read(ref, label, shallow=False):
+    """ref.get() that also records the payload size under label"""
+    value = ref.get(shallow=True) if shallow else ref.get()
+    _record_transfer(label, value)
+    return value
+
+
+def transfer_stats():
+    with _transfer_lock:
+        return {label: dict(counts) for label, counts in _transfer.items()}
+
+
+def fetch_records(node, ids, field=None, label=None):
+    """Fetch <node>/<id> (or just <node>/<id>/<field>) for every distinct id concurrently.
+
+    Missing records are left out. Reads are recorded under label, <node>/* by default.
+    """
+    ids = list(dict.fromkeys(i for i in ids if i))
+    if not ids:
+        return {}
+
+    db = get_db()
+    label = label or (f'{node}/*/{field}' if field else f'{node}/*')
+
+    def load(key):
+        ref = db.child(node).child(key)
+        return read(ref.child(field) if field else ref, label)
+
+    if len(ids) == 1:
+        values = [load(ids[0])]
+    else:
+        values = _pool.map(load, ids)
+
+    return {key: value for key, value in zip(ids, values) if value is not None}
@@ -0,0 +1,187 @@
+from firebase.firebase_config import get_db
+import copy
+import os
+import threading
+import time
+
+# Set BLOODLINK_REQUEST_MIRROR=1 to serve the donate page from an in-process copy of open requests
+REQUEST_MIRROR_ENABLED = os.environ.get('BLOODLINK_REQUEST_MIRROR') == '1'
+# Seconds to wait between attempts to re-open a dropped stream
+MIRROR_RETRY_SECONDS = float(os.environ.get('BLOODLINK_MIRROR_RETRY_SECONDS', 30))
+
+
+def _is_open(request):
+    return isinstance(request, dict) and request.get('status') == 'pending'
+
+
+def _set_path(node, segments, value):
+    for segment in segments[:-1]:
+        child = node.get(segment)
+        if not isinstance(child, dict):
+            child = node[segment] = {}
+        node = child
+    if value is None:
+        node.pop(segments[-1], None)
+    else:
+        node[segments[-1]] = value
+
+
+class RequestMirror:
+    """Open blood_requests kept current by a listen() stream on the node"""
+
+    def __init__(self):
+        self._requests = {}
+        self._lock = threading.Lock()
+        self._registration = None
+        self._error = None
+        self._last_event_at = None
+        self._started_at = None
+        self._dropped_at = None
+        self._last_attempt_at = 0.0
+        self.events = 0
+        self.fallbacks = 0
+
+    def start(self):
+        """Open the stream; its first event is the full snapshot that seeds the mirror"""
+        self._last_attempt_at = time.monotonic()
+        self._error = None
+        self._registration = get_db().child('blood_requests').listen(self._on_event)
+        self._started_at = time.monotonic()
+        self._dropped_at = None
+
+    def stop(self):
+        if self._registration is not None:
+            self._registration.close()
+            self._registration = None
+
+    def _on_event(self, event):
+        try:
+            data = event.data
+            if event.event_type == 'patch':
+                for key, value in (data or {}).items():
+                    self._apply(f"{event.path.rstrip('/')}/{key}", value)
+            elif event.event_type == 'put':
+                self._apply(event.path, data)
+            self._last_event_at = time.monotonic()
+            self.events += 1
+        except Exception as e:
+            self._error = str(e)
+            self._dropped_at = time.monotonic()
+
+    def _apply(self, path, data):
+        segments = [p for p in path.split('/') if p]
+
+        if not segments:
+            with self._lock:
+                self._requests = {rid: r for rid, r in (data or {}).items() if _is_open(r)}
+            return
+
+        rid = segments[0]
+        if len(segments) == 1:
+            with self._lock:
+                if _is_open(data):
+                    self._requests[rid] = data
+                else:
+                    self._requests.pop(rid, None)
+            return
+
+        # Partial change of one request
+        with self._lock:
+            record = self._requests.get(rid)
+            if record is not None:
+                _set_path(record, segments[1:], data)
+                if not _is_open(record):
+                    self._requests.pop(rid, None)
+                return
+
+        # Not mirrored (closed or unseen) - it may have just reopened; check the
+        # status leaf first and only read the whole record when it is open
+        ref = get_db().child('blood_requests').child(rid)
+        record = ref.get() if ref.child('status').get() == 'pending' else None
+        with self._lock:
+            if _is_open(record):
+                self._requests[rid] = record
+            else:
+                self._requests.pop(rid, None)
+
+    def is_live(self):
+        registration = self._registration
+        if registration is None or self._error or self._last_event_at is None:
+            return False
+        if hasattr(registration, 'is_alive'):
+            alive = registration.is_alive()
+        else:
+            # firebase_admin.db.ListenerRegistration runs the SSE stream on _thread
+            thread = getattr(registration, '_thread', None)
+            alive = thread is None or thread.is_alive()
+        if not alive and self._dropped_at is None:
+            self._dropped_at = time.monotonic()
+        return alive
+
+    def maybe_restart(self):
+        if time.monotonic() - self._last_attempt_at < MIRROR_RETRY_SECONDS:
+            return
+        try:
+            self.stop()
+        except Exception:
+            pass
+        try:
+            self.start()
+        except Exception as e:
+            self._error = str(e)
+
+    def open_requests(self):
+        with self._lock:
+            return copy.deepcopy(self._requests)
+
+    def staleness_seconds(self):
+        """0 while the stream is live, otherwise how long the mirror has been cut off"""
+        if self.is_live():
+            return 0.0
+        since = self._dropped_at or self._started_at
+        return round(time.monotonic() - since, 3) if since else None
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            'enabled': True,
+            'live': self.is_live(),
+            'staleness_seconds': self.staleness_seconds(),
+            'last_event_age_seconds': round(now - self._last_event_at, 3) if self._last_event_at else None,
+            'open_requests': len(self._requests),
+            'events': self.events,
+            'fallbacks': self.fallbacks,
+            'error': self._error
+        }
+
+
+_mirror = None
+
+
+def start_request_mirror():
+    global _mirror
+    if _mirror is None:
+        _mirror = RequestMirror()
+        try:
+            _mirror.start()
+        except Exception as e:
+            _mirror._error = str(e)
+    return _mirror
+
+
+def active_mirror():
+    """The mirror if it is live; None means callers should read the database directly"""
+    if _mirror is None:
+        return None
+    if _mirror.is_live():
+        return _mirror
+
+    _mirror.fallbacks += 1
+    _mirror.maybe_restart()
+    return None
+
+
+def mirror_stats():
+    if _mirror is None:
+        return {'enabled': False}
+    return _mirror.stats()
@@ -0,0 +1,141 @@
+from firebase.firebase_config import get_db
+from firebase.loader import fetch_records
+from collections import OrderedDict
+import copy
+import json
+import os
+import threading
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+USER_CACHE_TTL = float(os.environ.get('BLOODLINK_USER_CACHE_TTL', 60))
+USER_CACHE_SIZE = int(os.environ.get('BLOODLINK_USER_CACHE_SIZE', 2048))
+# e.g. redis://localhost:6379/0 - shared by all gunicorn workers so invalidation is seen everywhere
+USER_CACHE_URL = os.environ.get('BLOODLINK_USER_CACHE_URL')
+
+
+class LocalCache:
+    """Process-local LRU with a per-entry TTL"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return copy.deepcopy(value)
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, copy.deepcopy(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def size(self):
+        return len(self._data)
+
+
+class RedisCache:
+    """Shared cache so every worker sees the same entries and invalidations"""
+
+    def __init__(self, url, ttl):
+        if redis is None:
+            raise RuntimeError('BLOODLINK_USER_CACHE_URL is set but the redis package is not installed')
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(f'bloodlink:user:{key}')
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self._client.set(f'bloodlink:user:{key}', json.dumps(value), ex=max(int(self.ttl), 1))
+
+    def delete(self, key):
+        self._client.delete(f'bloodlink:user:{key}')
+
+    def size(self):
+        return None
+
+
+if USER_CACHE_URL:
+    _cache = RedisCache(USER_CACHE_URL, USER_CACHE_TTL)
+else:
+    _cache = LocalCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_user(uid):
+    """Read-through lookup of users/<uid>; returns None when the user does not exist"""
+    user = _cache.get(uid)
+    if user is not None:
+        _count('hits')
+        return user
+
+    _count('misses')
+    user = get_db().child('users').child(uid).get()
+    if user:
+        _cache.set(uid, user)
+    return user
+
+
+def get_users(uids):
+    """Batched get_user: cache hits first, then one concurrent fetch of the distinct misses"""
+    users = {}
+    missing = []
+    for uid in dict.fromkeys(u for u in uids if u):
+        user = _cache.get(uid)
+        if user is not None:
+            _count('hits')
+            users[uid] = user
+        else:
+            _count('misses')
+            missing.append(uid)
+
+    for uid, user in fetch_records('users', missing).items():
+        _cache.set(uid, user)
+        users[uid] = user
+
+    return users
+
+
+def invalidate_user(uid):
+    """Call after every write under users/<uid>"""
+    _cache.delete(uid)
+    _count('invalidations')
+
+
+def cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    stats['size'] = _cache.size()
+    stats['backend'] = 'redis' if isinstance(_cache, RedisCache) else 'local'
+    return stats
@@ -0,0 +1,177 @@
+"""Per-call and per-request metrics, rendered in the Prometheus text format at /metrics.
+
+Service functions are wrapped with @instrument. Counts are per process, so
+scrape every gunicorn worker (or run a single worker) to see the full picture.
+"""
+from functools import wraps
+from flask import g, request
+import bisect
+import itertools
+import json
+import os
+import threading
+import time
+
+# Serialize every Nth result of a function to sample its JSON size; 0 turns the size histogram off
+RESPONSE_SIZE_EVERY = int(os.environ.get('BLOODLINK_METRICS_SIZE_EVERY', 100))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_help = {}
+# Depth of instrumented calls on this thread; nested calls never measure their results
+_local = threading.local()
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, labels, amount=1, help_text=''):
+    with _lock:
+        _help.setdefault(name, ('counter', help_text))
+        key = (name, _labels_key(labels))
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, labels, value, buckets=LATENCY_BUCKETS, help_text=''):
+    with _lock:
+        _help.setdefault(name, ('histogram', help_text))
+        key = (name, _labels_key(labels))
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram(buckets)
+        histogram.observe(value)
+
+
+def _payload_size(result):
+    try:
+        return len(json.dumps(result, default=str))
+    except (TypeError, ValueError):
+        return None
+
+
+def instrument(func):
+    """Record calls, latency, errors and response size of a service function.
+
+    A call counts as an error when it raises or returns {'success': False, ...}.
+    Response size is sampled: only every RESPONSE_SIZE_EVERY-th outermost call
+    is serialized.
+    """
+    labels = {'function': f'{func.__module__}.{func.__name__}'}
+    calls = itertools.count()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_local, 'depth', 0)
+        _local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            inc('bloodlink_service_errors_total', labels, help_text='Service calls that raised or returned success=False')
+            raise
+        finally:
+            _local.depth = depth
+            observe('bloodlink_service_latency_seconds', labels, time.perf_counter() - start,
+                    help_text='Service call latency')
+            inc('bloodlink_service_calls_total', labels, help_text='Service calls')
+
+        if isinstance(result, dict) and result.get('success') is False:
+            inc('bloodlink_service_errors_total', labels, help_text='Service calls that raised or returned success=False')
+        if RESPONSE_SIZE_EVERY and depth == 0 and next(calls) % RESPONSE_SIZE_EVERY == 0:
+            size = _payload_size(result)
+            if size is not None:
+                observe('bloodlink_service_response_bytes', labels, size, buckets=SIZE_BUCKETS,
+                        help_text='JSON size of sampled service call results')
+        return result
+
+    return wrapper
+
+
+def init_app(app):
+    """Time every Flask request"""
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = getattr(g, '_metrics_start', None)
+        if start is not None:
+            labels = {
+                'method': request.method,
+                'endpoint': request.endpoint or 'unmatched',
+                'status': str(response.status_code)
+            }
+            observe('bloodlink_http_request_duration_seconds', labels, time.perf_counter() - start,
+                    help_text='Flask request latency')
+            inc('bloodlink_http_requests_total', labels, help_text='Flask requests')
+        return response
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    parts = []
+    for k, v in items:
+        value = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{k}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def render(gauges=None):
+    """Prometheus text exposition of everything recorded, plus optional gauges.
+
+    gauges maps a metric name to a value, or to a list of (labels dict, value)
+    for a labelled family.
+    """
+    lines = []
+    with _lock:
+        for name in sorted(_help):
+            kind, help_text = _help[name]
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(_counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_format_labels(labels)} {value}')
+            else:
+                for (metric, labels), histogram in sorted(_histograms.items(), key=lambda kv: kv[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {histogram.count}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {histogram.total}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f'# TYPE {name} gauge')
+        if isinstance(value, list):
+            for labels, sample in sorted(value, key=lambda item: _labels_key(item[0])):
+                lines.append(f'{name}{_format_labels(_labels_key(labels))} {sample}')
+        else:
+            lines.append(f'{name} {value}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,84 @@
+"""Rolling-origin backtests of the demand models.
+
+Each fold holds out `horizon` days after an origin and forecasts them from the
+history before it. Origins step back from the end of the series one horizon at
+a time, at most BACKTEST_FOLDS of them, and always leave BACKTEST_MIN_TRAIN
+days of history to train on. The scores give the accuracy shown for a group
+and, with FORECAST_WEIGHTING=inverse_mae, the weights of its ensemble.
+"""
+import os
+import numpy as np
+
+# Holdout windows per group; 0 turns backtesting off
+BACKTEST_FOLDS = int(os.environ.get('BLOODLINK_BACKTEST_FOLDS', 3))
+# Fewest days of history the earliest fold trains on
+BACKTEST_MIN_TRAIN = int(os.environ.get('BLOODLINK_BACKTEST_MIN_TRAIN', 28))
+
+# 'equal': every model counts the same; 'inverse_mae': weights proportional to 1 / backtest MAE
+WEIGHTINGS = ('equal', 'inverse_mae')
+FORECAST_WEIGHTING = os.environ.get('BLOODLINK_FORECAST_WEIGHTING', 'equal')
+
+
+def fold_origins(length, horizon, folds=None, min_train=None):
+    """Positions where each fold's holdout starts, oldest first; empty when the series is too short"""
+    folds = BACKTEST_FOLDS if folds is None else folds
+    min_train = BACKTEST_MIN_TRAIN if min_train is None else min_train
+    origins = [length - k * horizon for k in range(folds, 0, -1)]
+    return [origin for origin in origins if origin >= min_train]
+
+
+def score(actual, forecast):
+    """MAE, and MAPE in percent over the days with non-zero demand (None if there are none)"""
+    actual = np.asarray(actual, dtype=float)
+    error = np.abs(actual - np.asarray(forecast, dtype=float))
+    demand = actual > 0
+    return {
+        'mae': float(error.mean()),
+        'mape': float((error[demand] / actual[demand]).mean() * 100) if demand.any() else None
+    }
+
+
+def summarize(scores):
+    """Mean of each metric over the folds that have it"""
+    summary = {}
+    for metric in ('mae', 'mape'):
+        values = [s[metric] for s in scores if s[metric] is not None]
+        summary[metric] = round(float(np.mean(values)), 2) if values else None
+    return summary
+
+
+def weights(metrics, weighting=None):
+    """Ensemble weight per model from {model: summary or None (no backtest)}, for the models given.
+
+    Equal weighting covers every model given. inverse_mae only weights models
+    with a backtest, and falls back to equal when none has one.
+    """
+    weighting = FORECAST_WEIGHTING if weighting is None else weighting
+    scored = [name for name, summary in metrics.items() if summary and summary['mae'] is not None]
+    if weighting == 'inverse_mae' and scored:
+        inverse = {name: 1 / max(metrics[name]['mae'], 1e-6) for name in scored}
+        total = sum(inverse.values())
+        return {name: inverse[name] / total for name in scored}
+    return {name: 1 / len(metrics) for name in metrics}
+
+
+def combine(forecasts, model_weights):
+    """Weighted sum of {model: forecast} over the weighted models"""
+    return sum(model_weights[name] * np.asarray(forecasts[name], dtype=float) for name in model_weights)
+
+
+def accuracy(summary):
+    """Accuracy shown for a group: 100 - MAPE, floored at 0; None without a MAPE"""
+    if not summary or summary['mape'] is None:
+        return None
+    return round(max(0.0, 100 - summary['mape']), 1)
+
+
+def report(origins, horizon, metrics, ensemble, model_weights):
+    return {
+        'folds': len(origins),
+        'horizon': horizon,
+        'models': metrics,
+        'ensemble': ensemble,
+        'weights': {name: round(weight, 4) for name, weight in model_weights.items()}
+    }
@@ -1,86 +1,639 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from io import BytesIO
 import base64
-from datetime import timedelta
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
 
 # Models
 from statsmodels.tsa.holtwinters import ExponentialSmoothing
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 from prophet import Prophet
 
-from ml.preprocess import load_and_preprocess_data, get_clean_series
+from ml.preprocess import load_and_preprocess_data, build_daily_matrix, series_from_matrix
+from ml import backtest, forecast_cache, holt_winters, model_store, scheduler
+from ml.charts import chart_data, render_png
+from metrics import instrument
 
 import warnings
 warnings.filterwarnings("ignore")
 
-def predict_blood_demand(filepath):
-    df, error = load_and_preprocess_data(filepath)
+# Processes fitting department/blood type groups in parallel; 1 fits them in the request process
+FORECAST_WORKERS = int(os.environ.get('BLOODLINK_FORECAST_WORKERS', os.cpu_count() or 1))
+
+# 'data': numeric arrays under results['chart_data'] for the browser to draw; 'png': base64 images under results['charts']
+CHART_MODES = ('data', 'png')
+
+# 'ensemble': HW + SARIMAX + Prophet per group, within the time budget; 'fast': Holt-Winters only, long series in one batch
+MODELS = ('ensemble', 'fast')
+
+# Part of every forecast cache key: change it (or bump version) whenever the models or the chart change
+MODEL_CONFIG = {
+    'version': 4,
+    'horizon': 7,
+    'holt_winters': {'trend': 'add', 'seasonal': 'add', 'seasonal_periods': 7},
+    'sarimax': {'order': [1, 1, 1], 'seasonal_order': [1, 1, 1, 7]},
+    'prophet': {'yearly_seasonality': False, 'daily_seasonality': False, 'weekly_seasonality': True},
+    'backtest': {'folds': backtest.BACKTEST_FOLDS, 'min_train': backtest.BACKTEST_MIN_TRAIN,
+                 'weighting': backtest.FORECAST_WEIGHTING}
+}
+
+@instrument
+def warm_up():
+    """Pre-load the model stack (Stan backend, statsmodels, plotting) so the first upload is not slow"""
+    dates = pd.date_range(end=pd.Timestamp.today().normalize(), periods=28, freq='D')
+    series = pd.Series(np.tile([5.0, 6, 7, 6, 5, 3, 2], 4), index=dates, name='units')
+    series.index.name = 'date'
+
+    ExponentialSmoothing(series, trend='add', seasonal='add', seasonal_periods=7).fit()
+    SARIMAX(series, order=(1, 1, 1), seasonal_order=(1, 1, 1, 7)).fit(disp=False)
+    p_model = Prophet(yearly_seasonality=False, daily_seasonality=False, weekly_seasonality=True)
+    p_model.fit(series.reset_index().rename(columns={'date': 'ds', 'units': 'y'}))
+    render_png(chart_data('warm-up', series, np.zeros(7)))
+
+# Cheapest first: the scheduler always runs the first and adds the others while the group's budget allows
+MODEL_NAMES = ('holt_winters', 'sarimax', 'prophet')
+MODEL_LABELS = {'sarimax': 'SARIMAX', 'prophet': 'Prophet', 'holt_winters': 'HW'}
+
+
+def _holt_winters(series):
+    return ExponentialSmoothing(series, trend='add', seasonal='add', seasonal_periods=7).fit()
+
+
+def _sarimax_model(series):
+    return SARIMAX(series, order=(1, 1, 1), seasonal_order=(1, 1, 1, 7))
+
+
+def _sarimax(series, start_params=None):
+    return _sarimax_model(series).fit(start_params=start_params, disp=False)
+
+
+def _sarimax_state(fit, horizon):
+    """What ml.model_store keeps of a SARIMAX fit: its parameters, the state after the last day and the forecast.
+
+    A few hundred floats, however long the history; the results object
+    itself carries the data and every filter output.
+    """
+    return {
+        'params': fit.params.to_numpy(),
+        'state': fit.predicted_state[:, -1],
+        'state_cov': fit.predicted_state_cov[:, :, -1],
+        'forecast': fit.forecast(horizon).to_numpy()
+    }
+
+
+def _prophet(series, init=None):
+    model = Prophet(yearly_seasonality=False, daily_seasonality=False, weekly_seasonality=True)
+    frame = series.reset_index().rename(columns={'date': 'ds', 'units': 'y'})
+    if init is None:
+        model.fit(frame)
+    else:
+        model.fit(frame, init=init)
+    return model
+
+
+def _prophet_forecast(model, horizon):
+    future = model.make_future_dataframe(periods=horizon).tail(horizon)
+    return model.predict(future)['yhat'].to_numpy()
+
+
+def _prophet_params(model):
+    """A fitted Prophet's parameters in the form fit(init=...) warm-starts from"""
+    params = {name: model.params[name][0][0] for name in ('k', 'm', 'sigma_obs')}
+    params.update({name: model.params[name][0] for name in ('delta', 'beta')})
+    return params
+
+
+def _prophet_warm(series, params):
+    try:
+        return _prophet(series, params)
+    except Exception:
+        # A warm start from a shorter history can have fewer changepoints
+        return _prophet(series)
+
+
+# Backtests: (forecast at each origin, seed for the final fit). Each model is
+# fitted once, at the earliest origin, and carried forward: Holt-Winters reruns
+# its recursion with the fitted parameters and initial states, SARIMAX appends
+# the later days without refitting, and Prophet warm-starts from the previous fold.
+
+def _backtest_holt_winters(series, origins, horizon):
+    fit = _holt_winters(series.iloc[:origins[0]])
+    params = fit.params
+    folds = [fit.forecast(horizon).to_numpy()]
+    for origin in origins[1:]:
+        known = ExponentialSmoothing(series.iloc[:origin], trend='add', seasonal='add', seasonal_periods=7,
+                                     initialization_method='known', initial_level=params['initial_level'],
+                                     initial_trend=params['initial_trend'],
+                                     initial_seasonal=params['initial_seasons'])
+        refit = known.fit(smoothing_level=params['smoothing_level'], smoothing_trend=params['smoothing_trend'],
+                          smoothing_seasonal=params['smoothing_seasonal'], optimized=False)
+        folds.append(refit.forecast(horizon).to_numpy())
+    return folds, None
+
+
+def _backtest_sarimax(series, origins, horizon):
+    fit = _sarimax(series.iloc[:origins[0]])
+    folds = [fit.forecast(horizon).to_numpy()]
+    for origin in origins[1:]:
+        folds.append(fit.append(series.iloc[origins[0]:origin]).forecast(horizon).to_numpy())
+    return folds, fit.params.to_numpy()
+
+
+def _backtest_prophet(series, origins, horizon):
+    model = _prophet(series.iloc[:origins[0]])
+    folds = [_prophet_forecast(model, horizon)]
+    for origin in origins[1:]:
+        model = _prophet_warm(series.iloc[:origin], _prophet_params(model))
+        folds.append(_prophet_forecast(model, horizon))
+    return folds, _prophet_params(model)
+
+
+# Final fits: (forecast, state kept by ml.model_store). The seed from the
+# backtest starts SARIMAX's and Prophet's optimization near the optimum.
+
+def _fit_holt_winters(series, horizon, seed):
+    fit = _holt_winters(series)
+    return fit.forecast(horizon).to_numpy(), holt_winters.state_from_statsmodels(fit)
+
+
+def _fit_sarimax(series, horizon, seed):
+    state = _sarimax_state(_sarimax(series, seed), horizon)
+    return state['forecast'], state
+
+
+def _fit_prophet(series, horizon, seed):
+    model = _prophet_warm(series, seed) if seed is not None else _prophet(series)
+    return _prophet_forecast(model, horizon), _prophet_params(model)
+
+
+# Updates: (forecast, state) from a stored state and the days appended since.
+# Holt-Winters' update runs first, in _update_models, because it decides on drift.
+
+def _update_sarimax(state, series, new_days, horizon):
+    if state is None:
+        return _fit_sarimax(series, horizon, None)
+    if not len(new_days):
+        return state['forecast'], state
+    # Filter only the new days, starting from the stored state, with the stored parameters
+    model = _sarimax_model(new_days)
+    model.initialize_known(state['state'], state['state_cov'])
+    updated = _sarimax_state(model.filter(state['params']), horizon)
+    return updated['forecast'], updated
+
+
+def _update_prophet(state, series, new_days, horizon):
+    # Prophet has no incremental update; refit warm-started from the stored parameters
+    return _fit_prophet(series, horizon, state)
+
+
+_BACKTESTS = {'holt_winters': _backtest_holt_winters, 'sarimax': _backtest_sarimax, 'prophet': _backtest_prophet}
+_FITS = {'holt_winters': _fit_holt_winters, 'sarimax': _fit_sarimax, 'prophet': _fit_prophet}
+_UPDATES = {'sarimax': _update_sarimax, 'prophet': _update_prophet}
+
+
+def _timed(task, runs, name, step):
+    """Run step() for model name, recording status, seconds and the scheduler task in runs[name].
+
+    The caller feeds the timing to the scheduler (_record_costs), in the web
+    process even when the group ran in a worker.
+    """
+    start = time.time()
+    try:
+        runs[name] = {'status': 'ok', **step()}
+    except Exception as e:
+        runs[name] = {'status': 'failed', 'error': str(e) or type(e).__name__}
+    runs[name]['seconds'] = round(time.time() - start, 3)
+    runs[name]['task'] = task
+
+
+def _record_costs(entry):
+    """scheduler.observe() every model timing in a group's entry"""
+    for run in entry.get('models_run', {}).values():
+        if run.get('task'):
+            scheduler.observe(run['task'], run['seconds'])
+
+
+def _fit_models(series, origins, horizon, deadline):
+    """{model: run} for MODEL_NAMES, cheapest first while the budget allows.
+
+    A run has status ('ok', 'failed' or 'skipped'), seconds, and when ok the
+    forecast, the state for the model store and the backtest folds (None when
+    there are no origins or the backtest failed).
+    """
+    runs = {}
+    for i, name in enumerate(MODEL_NAMES):
+        if i and not scheduler.affordable(name, deadline):
+            runs[name] = {'status': 'skipped', 'reason': 'time budget', 'seconds': 0.0}
+            continue
+
+        def step(name=name):
+            folds, seed = None, None
+            if origins:
+                try:
+                    folds, seed = _BACKTESTS[name](series, origins, horizon)
+                except Exception:
+                    pass
+            forecast, state = _FITS[name](series, horizon, seed)
+            return {'forecast': forecast, 'state': state, 'folds': folds}
+
+        _timed(name, runs, name, step)
+    return runs
+
+
+def _update_models(models, series, new_days, horizon, deadline):
+    """{model: run} after carrying stored models over new_days, the tail of series; None on drift.
+
+    Holt-Winters runs its recursion over the new days with the stored
+    parameters and always runs; drift is judged on its one-step errors against
+    its in-sample MAE. SARIMAX and Prophet follow while the budget allows.
+    """
+    if models.get('holt_winters') is None:
+        return None
+    start = time.time()
+    state, errors = holt_winters.update_state(models['holt_winters'], new_days)
+    if len(errors) and np.abs(errors).mean() > model_store.MODEL_DRIFT_RATIO * max(state['mae'], 1e-6):
+        return None
+
+    runs = {'holt_winters': {'status': 'ok', 'forecast': holt_winters.forecast_state(state, horizon),
+                             'state': state, 'seconds': round(time.time() - start, 3),
+                             'task': 'holt_winters:update'}}
+    for name in MODEL_NAMES[1:]:
+        task = f'{name}:update'
+        if not scheduler.affordable(task, deadline):
+            runs[name] = {'status': 'skipped', 'reason': 'time budget', 'seconds': 0.0}
+            continue
+
+        def step(name=name):
+            forecast, updated = _UPDATES[name](models.get(name), series, new_days, horizon)
+            return {'forecast': forecast, 'state': updated}
+
+        _timed(task, runs, name, step)
+    return runs
+
+
+def _backtest_report(series, origins, horizon, runs):
+    """backtest.report() over the models whose backtest ran; None when none did"""
+    folds = {name: run['folds'] for name, run in runs.items() if run['status'] == 'ok' and run.get('folds')}
+    if not folds:
+        return None
+    actuals = [series.iloc[origin:origin + horizon] for origin in origins]
+
+    metrics = {name: backtest.summarize([backtest.score(actual, np.maximum(forecast, 0))
+                                         for actual, forecast in zip(actuals, model_folds)])
+               for name, model_folds in folds.items()}
+    model_weights = backtest.weights(metrics)
+    ensemble = [backtest.score(actual, np.maximum(backtest.combine({n: f[i] for n, f in folds.items()}, model_weights), 0))
+                for i, actual in enumerate(actuals)]
+    return backtest.report(origins, horizon, metrics, backtest.summarize(ensemble), model_weights)
+
+
+def _model_label(names):
+    if not names:
+        return "Seasonal naive (no model finished)"
+    labels = [MODEL_LABELS[name] for name in MODEL_LABELS if name in names]
+    return f"Ensemble ({' + '.join(labels)})" if len(labels) > 1 else labels[0]
+
+
+def forecast_group(dept, bt, series, charts='png', hospital=None, deadline=None, costs=None):
+    """Forecast and chart (chart_data() arrays, or a base64 PNG) for one (department, blood type) series.
+
+    Models run cheapest first within the group's time budget (ml.scheduler;
+    deadline is the job's). The ensemble averages the models that succeeded,
+    weighted by their rolling-origin backtests (ml.backtest), which also give
+    the reported accuracy. If none succeeds the forecast repeats the last week.
+    With a hospital, the fitted models are kept in ml.model_store and the next
+    upload that only appends days updates them instead of refitting. Depends on
+    its arguments and the store only, so it can run in a worker process; costs
+    is then the web process's scheduler.expected_costs().
+    """
+    if costs: scheduler.use_costs(costs)
+    horizon = MODEL_CONFIG['horizon']
+    deadline = scheduler.group_deadline(deadline)
+    use_store = hospital is not None and model_store.MODEL_STORE_ENABLED
+    record = model_store.load(hospital, dept, bt) if use_store else None
+    new_days, reason = model_store.plan(record, series, MODEL_CONFIG)
+    runs = _update_models(record['models'], series, new_days, horizon, deadline) if new_days is not None else None
+
+    if runs:
+        report = record['backtest']
+        model_state = {'action': 'updated', 'new_days': len(new_days)}
+    else:
+        origins = backtest.fold_origins(len(series), horizon) if backtest.BACKTEST_FOLDS else []
+        runs = _fit_models(series, origins, horizon, deadline)
+        report = _backtest_report(series, origins, horizon, runs) if origins else None
+        model_state = {'action': 'refit', 'reason': 'drift' if new_days is not None else reason}
+
+    succeeded = [name for name in MODEL_NAMES if runs[name]['status'] == 'ok']
+    metrics = report['models'] if report else {}
+    model_weights = backtest.weights({name: metrics.get(name) for name in succeeded}) if succeeded else {}
+
+    if use_store:
+        stored = record['models'] if record and model_state['action'] == 'updated' else {}
+        models = {name: runs[name]['state'] if runs[name]['status'] == 'ok' else stored.get(name) for name in MODEL_NAMES}
+        model_store.save(hospital, dept, bt, series, MODEL_CONFIG, models, report,
+                         updates=record['updates'] + 1 if model_state['action'] == 'updated' else 0,
+                         fitted_at=record['fitted_at'] if model_state['action'] == 'updated' else None)
+
+    if succeeded:
+        forecast = backtest.combine({name: runs[name]['forecast'] for name in succeeded}, model_weights)
+    else:
+        forecast = np.resize(series.to_numpy(dtype=float)[-7:], horizon)
+    final_forecast = np.maximum(forecast, 0) # No negative blood units
+
+    entry = {
+        'predicted_7d': round(float(sum(final_forecast)), 1),
+        'accuracy': backtest.accuracy(report['ensemble'] if report else None),
+        'model_used': _model_label(succeeded),
+        'models_run': {name: {key: value for key, value in run.items()
+                              if key in ('status', 'seconds', 'error', 'reason', 'task')}
+                       for name, run in runs.items()},
+        'backtest': report,
+        'model_state': model_state if use_store else None
+    }
+    return entry, _chart(dept, bt, series, final_forecast, charts)
+
+
+def _chart(dept, bt, series, forecast, charts):
+    chart = chart_data(f"{dept} - {bt} | Demand Prediction", series, forecast)
+    if charts == 'png':
+        chart = base64.b64encode(render_png(chart)).decode()
+    return chart
+
+
+def _hw_forecasts(series_list, horizon):
+    """(len(series_list), horizon) Holt-Winters forecasts.
+
+    Series of at least holt_winters.BATCH_MIN_LENGTH days are fitted in one
+    batch, shorter ones with statsmodels (see ml.holt_winters).
+    """
+    forecasts = np.zeros((len(series_list), horizon))
+    batch = [i for i, series in enumerate(series_list) if len(series) >= holt_winters.BATCH_MIN_LENGTH]
+    if batch:
+        forecasts[batch] = holt_winters.forecast_series([series_list[i] for i in batch], horizon)
+    for i, series in enumerate(series_list):
+        if len(series) < holt_winters.BATCH_MIN_LENGTH:
+            forecasts[i] = _holt_winters(series).forecast(horizon).to_numpy()
+    return forecasts
+
+
+def _fast_backtests(groups, horizon):
+    """backtest.report() per group for the fast model; the folds of every group are fitted together"""
+    origins = [backtest.fold_origins(len(series), horizon) if backtest.BACKTEST_FOLDS else []
+               for _, _, series in groups]
+    train = [series.iloc[:origin] for (_, _, series), starts in zip(groups, origins) for origin in starts]
+    forecasts = iter(np.maximum(_hw_forecasts(train, horizon), 0))
+
+    reports = []
+    for (_, _, series), starts in zip(groups, origins):
+        if not starts:
+            reports.append(None)
+            continue
+        summary = backtest.summarize([backtest.score(series.iloc[origin:origin + horizon], next(forecasts))
+                                      for origin in starts])
+        reports.append(backtest.report(starts, horizon, {'holt_winters_fast': summary}, summary,
+                                       {'holt_winters_fast': 1.0}))
+    return reports
+
+
+def _fast_groups(groups, charts, on_done=None, degraded=None):
+    """Holt-Winters over every (dept, bt, series) at once (see _hw_forecasts); same outputs as _map_groups.
+
+    degraded, when given, says why these groups fell back to the batch model.
+    """
+    horizon = MODEL_CONFIG['horizon']
+    start = time.time()
+    forecasts = np.maximum(_hw_forecasts([series for _, _, series in groups], horizon), 0)
+    reports = _fast_backtests(groups, horizon)
+    seconds = round(time.time() - start, 3)
+    outputs = []
+    for (dept, bt, series), forecast, report in zip(groups, forecasts, reports):
+        entry = {
+            'predicted_7d': round(float(sum(forecast)), 1),
+            'accuracy': backtest.accuracy(report['ensemble'] if report else None),
+            'model_used': "Holt-Winters (fast, batch)" if len(series) >= holt_winters.BATCH_MIN_LENGTH
+                          else "Holt-Winters (fast)",
+            'models_run': {'holt_winters_fast': {'status': 'ok', 'seconds': seconds}},
+            'backtest': report
+        }
+        if degraded: entry['degraded'] = degraded
+        outputs.append((entry, _chart(dept, bt, series, forecast, charts)))
+        if on_done: on_done()
+    return outputs
+
+
+# Shared process pool per worker count: {'executor', 'users' (jobs using it), 'retired'}
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_context():
+    """Start method for the pool: the web process runs threads, and forking a threaded process can deadlock.
+
+    The forkserver imports this module once and forks clean workers from it;
+    spawn is the fallback where forkserver is unavailable.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def _terminate(pool):
+    """Shut pool down and kill its workers, including ones stuck in a fit"""
+    processes = list((pool._processes or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+
+def _acquire_pool(workers):
+    """The shared pool with this many workers, counted as used by the caller until _release_pool"""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context())
+            pool = _pools[workers] = {'executor': executor, 'users': 0, 'retired': False}
+        pool['users'] += 1
+        return pool
+
+
+def _retire_pool(workers, pool):
+    """Stop handing pool out; later jobs start a fresh one"""
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+        pool['retired'] = True
+
+
+def _release_pool(pool):
+    """Drop the caller's use of pool, killing its workers if it is retired and no other job still uses it"""
+    with _pools_lock:
+        pool['users'] -= 1
+        idle = pool['retired'] and not pool['users']
+    if idle:
+        _terminate(pool['executor'])
+
+
+def _map_groups(groups, workers, charts, on_done=None, hospital=None, deadline=None):
+    """forecast_group over every (dept, bt, series), results in input order; on_done() runs after each group.
+
+    On the process pool, groups still running FORECAST_BUDGET_GRACE seconds
+    after the job's deadline are abandoned and come back as None. The pool
+    is retired then, and its workers (the stuck fits among them) are killed
+    once the other jobs sharing it have finished.
+    """
+    if workers <= 1 or len(groups) <= 1:
+        outputs = []
+        for group in groups:
+            outputs.append(forecast_group(*group, charts, hospital, deadline))
+            _record_costs(outputs[-1][0])
+            if on_done: on_done()
+        return outputs
+
+    pool = _acquire_pool(workers)
+    costs = scheduler.expected_costs()
+    outputs = [None] * len(groups)
+    timeout = None if deadline is None else scheduler.remaining(deadline) + scheduler.FORECAST_BUDGET_GRACE
+    try:
+        futures = {pool['executor'].submit(forecast_group, *group, charts, hospital, deadline, costs): i
+                   for i, group in enumerate(groups)}
+        for future in as_completed(futures, timeout=timeout):
+            outputs[futures[future]] = future.result()
+            _record_costs(outputs[futures[future]][0])
+            if on_done: on_done()
+    except FuturesTimeout:
+        # Drop this job's queued groups only; other jobs may still be running on the pool
+        for future in futures:
+            future.cancel()
+        _retire_pool(workers, pool)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool next time
+        _retire_pool(workers, pool)
+        raise
+    finally:
+        _release_pool(pool)
+    return outputs
+
+
+def _complete(entry):
+    """Whether an entry is worth caching: every model ran or failed on its own, none was cut by the budget.
+
+    Incremental updates are not cached either: they depend on the stored
+    models as well as the series, and the cache key covers only the series.
+    """
+    if (entry.get('model_state') or {}).get('action') == 'updated':
+        return False
+    return not entry.get('degraded') and all(run['status'] != 'skipped' for run in entry.get('models_run', {}).values())
+
+
+def _schedule_summary(entries, budget, seconds):
+    """How many groups each model ran, failed or was skipped in, and how many fell back to the batch model"""
+    models_run = {}
+    for entry in entries:
+        for name, run in entry.get('models_run', {}).items():
+            counts = models_run.setdefault(name, {'ok': 0, 'failed': 0, 'skipped': 0})
+            counts[run['status']] += 1
+    return {
+        'budget': budget,
+        'seconds': round(seconds, 3),
+        'models_run': models_run,
+        'degraded_groups': sum(1 for entry in entries if entry.get('degraded'))
+    }
+
+
+@instrument
+def predict_blood_demand(source, workers=None, progress=None, charts='png', model='ensemble', hospital=None, fmt=None,
+                         budget=None):
+    """Forecast every (department, blood type) group in the file.
+
+    Groups whose series and MODEL_CONFIG match a result cached for the same
+    hospital are not refitted.
+    The rest are fitted on `workers` processes (default FORECAST_WORKERS) and
+    merged in file order, so the result matches a serial run. progress(done, total)
+    is called as groups complete. charts is one of CHART_MODES and model one of
+    MODELS; 'fast' fits Holt-Winters alone in this process instead, the long series in one batch.
+    hospital scopes the ensemble's stored models (see forecast_group).
+    source and fmt are as for load_and_preprocess_data: a path, or a file object and its format.
+
+    The job has budget seconds (default FORECAST_JOB_BUDGET, see ml.scheduler).
+    Groups that run out of it keep their cheaper models, and groups the pool
+    does not return in time fall back to the batch model; results['schedule']
+    counts which models ran. Results cut short by the budget are not cached.
+    """
+    started = time.time()
+    budget = scheduler.FORECAST_JOB_BUDGET if budget is None else budget
+    deadline = scheduler.job_deadline(budget)
+    if charts not in CHART_MODES: return {'success': False, 'error': f'Unknown chart mode: {charts}'}
+    if model not in MODELS: return {'success': False, 'error': f'Unknown model: {model}'}
+    df, error = load_and_preprocess_data(source, fmt)
     if error: return {'success': False, 'error': error}
     
-    results = {'success': True, 'departments': {}, 'charts': {}}
+    chart_key = 'charts' if charts == 'png' else 'chart_data'
+    results = {'success': True, 'departments': {}, chart_key: {}}
     depts = df['department'].unique()
+    matrix = build_daily_matrix(df)
     
+    groups = []
     for dept in depts:
         results['departments'][dept] = {'blood_types': {}}
         bt_list = df[df['department'] == dept]['blood_type'].unique()
         
         for bt in bt_list:
-            series = get_clean_series(df, dept, bt)
+            series = series_from_matrix(matrix, dept, bt)
             if series is None or len(series) < 14: continue # Need min 2 weeks for these models
+            groups.append((dept, bt, series))
+
+    outputs = [None] * len(groups)
+    keys = [None] * len(groups)
+    if forecast_cache.FORECAST_CACHE_ENABLED:
+        for i, (dept, bt, series) in enumerate(groups):
+            keys[i] = forecast_cache.series_key({**MODEL_CONFIG, 'charts': charts, 'model': model}, dept, bt, series)
+            cached = forecast_cache.get(keys[i], hospital)
+            if cached is not None:
+                outputs[i] = (cached['entry'], cached['chart'])
+
+    misses = [i for i, output in enumerate(outputs) if output is None]
+    done = [len(groups) - len(misses)]
+
+    def on_done():
+        done[0] += 1
+        progress(done[0], len(groups))
+
+    if progress: progress(done[0], len(groups))
+    if model == 'fast':
+        fitted = _fast_groups([groups[i] for i in misses], charts, on_done if progress else None)
+    else:
+        fitted = _map_groups([groups[i] for i in misses], FORECAST_WORKERS if workers is None else workers,
+                             charts, on_done if progress else None, hospital, deadline)
+        late = [groups[i] for i, output in zip(misses, fitted) if output is None]
+        if late:
+            fallback = iter(_fast_groups(late, charts, on_done if progress else None, degraded='job time budget'))
+            fitted = [output or next(fallback) for output in fitted]
+    stored = False
+    for i, (entry, chart) in zip(misses, fitted):
+        outputs[i] = (entry, chart)
+        if entry.get('model_state'):
+            stored = True
+            model_store.count('updates' if entry['model_state']['action'] == 'updated' else 'refits')
+        if keys[i] and _complete(entry):
+            forecast_cache.put(keys[i], {'entry': entry, 'chart': chart}, hospital)
+    # Once per upload, not per saved group: eviction walks the whole store
+    if stored: model_store.evict()
 
-            # 1. Holt-Winters (Exponential Smoothing)
-            try:
-                hw_model = ExponentialSmoothing(series, trend='add', seasonal='add', seasonal_periods=7).fit()
-                hw_forecast = hw_model.forecast(7)
-            except: hw_forecast = np.zeros(7)
-
-            # 2. SARIMAX (Seasonal ARIMA)
-            try:
-                sarima_model = SARIMAX(series, order=(1, 1, 1), seasonal_order=(1, 1, 1, 7)).fit(disp=False)
-                sarima_forecast = sarima_model.forecast(7)
-            except: sarima_forecast = np.zeros(7)
-
-            # 3. Prophet
-            try:
-                p_df = series.reset_index().rename(columns={'date': 'ds', 'units': 'y'})
-                p_model = Prophet(yearly_seasonality=False, daily_seasonality=False, weekly_seasonality=True)
-                p_model.fit(p_df)
-                future = p_model.make_future_dataframe(periods=7)
-                p_forecast = p_model.predict(future)['yhat'].tail(7).values
-            except: p_forecast = np.zeros(7)
-
-            # Ensemble: Average of the three models
-            final_forecast = (hw_forecast + sarima_forecast + p_forecast) / 3
-            final_forecast = np.maximum(final_forecast, 0) # No negative blood units
-            
-            results['departments'][dept]['blood_types'][bt] = {
-                'predicted_7d': round(float(sum(final_forecast)), 1),
-                'accuracy': 88.4, # Heuristic for display
-                'model_used': "Ensemble (SARIMAX + Prophet + HW)"
-            }
-
-            # --- PLOTTING ---
-            plt.figure(figsize=(10, 4))
-            plt.plot(series.index, series.values, color='#2c3e50', label='Historical Demand', linewidth=2)
-            
-            future_dates = [series.index[-1] + timedelta(days=i) for i in range(1, 8)]
-            plt.plot(future_dates, final_forecast, color='#e74c3c', linestyle='--', marker='o', label='7-Day Forecast')
-            
-            # Spike Detection
-            threshold = series.mean() + (2 * series.std())
-            spikes = series[series > threshold]
-            plt.scatter(spikes.index, spikes.values, color='orange', label='Demand Spikes', zorder=5)
-
-            plt.title(f"{dept} - {bt} | Demand Prediction")
-            plt.legend()
-            plt.tight_layout()
-
-            buf = BytesIO()
-            plt.savefig(buf, format='png')
-            plt.close()
-            chart_id = f"{dept}_{bt}".replace(" ", "_")
-            results['charts'][chart_id] = base64.b64encode(buf.getvalue()).decode()
+    for (dept, bt, _), (entry, chart) in zip(groups, outputs):
+        results['departments'][dept]['blood_types'][bt] = entry
+        chart_id = f"{dept}_{bt}".replace(" ", "_")
+        results[chart_key][chart_id] = chart
 
+    results['schedule'] = _schedule_summary([entry for entry, _ in outputs], budget, time.time() - started)
     return results
@@ -0,0 +1,160 @@
+"""Disk cache of per-group forecast results, keyed by the content of the series.
+
+A key hashes the model configuration, the group and its normalized daily
+series, so re-uploading a file only refits the groups whose history changed.
+Entries live under one directory per hospital (the scope), so one
+hospital's results are never served to another and clear() can drop a
+single hospital. Files are evicted least-recently-used across all scopes
+once the cache grows past FORECAST_CACHE_MAX_BYTES. Each process tracks the
+cache's size from its own writes and only walks the directory when that
+total passes the limit or every FORECAST_CACHE_RESCAN_EVERY writes, which
+also picks up what other processes wrote. Safe to share between worker
+processes: writes are atomic renames and a lost race only costs a refit.
+"""
+import hashlib
+import json
+import os
+import threading
+
+FORECAST_CACHE_DIR = os.environ.get('BLOODLINK_FORECAST_CACHE_DIR', 'forecast_cache')
+FORECAST_CACHE_MAX_BYTES = int(os.environ.get('BLOODLINK_FORECAST_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+# Set BLOODLINK_FORECAST_CACHE=0 to always refit
+FORECAST_CACHE_ENABLED = os.environ.get('BLOODLINK_FORECAST_CACHE', '1') != '0'
+# Writes between two walks of the cache directory to recount its size
+FORECAST_CACHE_RESCAN_EVERY = int(os.environ.get('BLOODLINK_FORECAST_CACHE_RESCAN_EVERY', 500))
+
+_stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+_stats_lock = threading.Lock()
+# Cache size as of the last walk plus this process's writes since (None until the first walk)
+_size = {'bytes': None, 'writes': 0}
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def series_key(config, dept, bt, series):
+    """sha256 of the model config, the group and the daily series (start date and float64 values)"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(config, sort_keys=True).encode())
+    digest.update(json.dumps([str(dept), str(bt), series.index[0].isoformat(), len(series)]).encode())
+    digest.update(series.to_numpy(dtype='float64').tobytes())
+    return digest.hexdigest()
+
+
+def _scope_dir(scope):
+    """Directory of a hospital's entries; uploads without a hospital share one"""
+    if scope is None:
+        return os.path.join(FORECAST_CACHE_DIR, 'shared')
+    return os.path.join(FORECAST_CACHE_DIR, hashlib.sha256(str(scope).encode()).hexdigest()[:16])
+
+
+def _path(key, scope):
+    return os.path.join(_scope_dir(scope), key[:2], f'{key}.json')
+
+
+def get(key, scope=None):
+    """Cached value or None; a hit refreshes the entry's position in the eviction order"""
+    path = _path(key, scope)
+    try:
+        with open(path) as f:
+            value = json.load(f)
+        os.utime(path)
+    except (OSError, ValueError):
+        _count('misses')
+        return None
+    _count('hits')
+    return value
+
+
+def put(key, value, scope=None):
+    path = _path(key, scope)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        replaced = os.stat(path).st_size
+    except OSError:
+        replaced = 0
+    data = json.dumps(value)
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    _count('writes')
+    _track(len(data) - replaced)
+
+
+def _track(delta):
+    """Add a write's size change to the tracked total; evict when it passes the limit or a rescan is due"""
+    with _stats_lock:
+        _size['writes'] += 1
+        if _size['bytes'] is not None:
+            _size['bytes'] += delta
+        due = (_size['bytes'] is None or _size['bytes'] > FORECAST_CACHE_MAX_BYTES
+               or _size['writes'] >= FORECAST_CACHE_RESCAN_EVERY)
+    if due:
+        _evict()
+
+
+def _entries(directory=FORECAST_CACHE_DIR):
+    entries = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+    return entries
+
+
+def _evict():
+    """Recount the cache; drop least recently used entries until it is back under 90% of the size limit"""
+    entries = _entries()
+    total = sum(size for _, size, _ in entries)
+    if total > FORECAST_CACHE_MAX_BYTES:
+        target = FORECAST_CACHE_MAX_BYTES * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            _count('evictions')
+
+    with _stats_lock:
+        _size['bytes'] = total
+        _size['writes'] = 0
+
+
+def clear(scope=None):
+    """Remove the cached forecasts of one hospital; returns how many entries were deleted"""
+    removed = 0
+    for _, _, path in _entries(_scope_dir(scope)):
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    # Recount on the next write
+    with _stats_lock:
+        _size['bytes'] = None
+    return removed
+
+
+def cache_stats():
+    entries = _entries()
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    stats['entries'] = len(entries)
+    stats['bytes'] = sum(size for _, size, _ in entries)
+    stats['max_bytes'] = FORECAST_CACHE_MAX_BYTES
+    stats['enabled'] = FORECAST_CACHE_ENABLED
+    return stats
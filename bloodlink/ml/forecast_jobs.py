@@ -0,0 +1,153 @@
+"""Background forecast jobs with progress.
+
+Uploads are queued on a small thread pool in the web process instead of being
+forecast inside the request. Job state lives in FORECAST_JOB_DIR so a status
+poll can be answered by any gunicorn worker; the job itself runs in the worker
+that accepted it. The queue is bounded per process and per hospital, and a
+full queue rejects new jobs instead of letting them pile up.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+FORECAST_JOB_DIR = os.environ.get('BLOODLINK_FORECAST_JOB_DIR', 'forecast_jobs')
+# Jobs running at once in this process; each fans its groups out to the forecast process pool
+FORECAST_JOB_WORKERS = int(os.environ.get('BLOODLINK_FORECAST_JOB_WORKERS', 1))
+# Queued + running jobs this process accepts before rejecting new ones
+FORECAST_JOB_QUEUE_SIZE = int(os.environ.get('BLOODLINK_FORECAST_JOB_QUEUE_SIZE', 8))
+FORECAST_JOBS_PER_OWNER = int(os.environ.get('BLOODLINK_FORECAST_JOBS_PER_OWNER', 2))
+# Seconds a finished job and its result are kept for polling
+FORECAST_JOB_TTL = float(os.environ.get('BLOODLINK_FORECAST_JOB_TTL', 3600))
+
+_JOB_ID = re.compile(r'[0-9a-f]{32}')
+
+_pool = ThreadPoolExecutor(max_workers=FORECAST_JOB_WORKERS, thread_name_prefix='forecast-job')
+_active = {}
+_active_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    """Raised by submit() when the job cannot be accepted right now"""
+
+
+def _path(job_id, suffix):
+    return os.path.join(FORECAST_JOB_DIR, f'{job_id}.{suffix}.json')
+
+
+def _write(job_id, suffix, value):
+    os.makedirs(FORECAST_JOB_DIR, exist_ok=True)
+    path = _path(job_id, suffix)
+    tmp = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(value, f, default=str)
+    os.replace(tmp, path)
+
+
+def _read(job_id, suffix):
+    if not _JOB_ID.fullmatch(job_id or ''):
+        return None
+    try:
+        with open(_path(job_id, suffix)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def submit(upload, fmt, owner, charts='data', model='ensemble', hospital=None):
+    """Queue a forecast of upload (a binary file object in format fmt) and return its job id.
+
+    The job closes upload when it is done.
+    """
+    with _active_lock:
+        if len(_active) >= FORECAST_JOB_QUEUE_SIZE:
+            raise QueueFull('The forecast queue is full, please try again in a few minutes')
+        if sum(1 for o in _active.values() if o == owner) >= FORECAST_JOBS_PER_OWNER:
+            raise QueueFull('Your previous forecasts are still running, please wait for them to finish')
+        job_id = uuid.uuid4().hex
+        _active[job_id] = owner
+
+    state = {
+        'job_id': job_id,
+        'owner': owner,
+        'status': 'queued',
+        'progress': {'done': 0, 'total': None},
+        'created_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+        'error': None
+    }
+    _write(job_id, 'status', state)
+    _pool.submit(_run, job_id, upload, fmt, charts, model, hospital, state)
+    _prune()
+    return job_id
+
+
+def _run(job_id, upload, fmt, charts, model, hospital, state):
+    try:
+        state.update(status='running', started_at=time.time())
+        _write(job_id, 'status', state)
+
+        def progress(done, total):
+            state['progress'] = {'done': done, 'total': total}
+            _write(job_id, 'status', state)
+
+        from ml.forecast import predict_blood_demand
+        result = predict_blood_demand(upload, progress=progress, charts=charts, model=model, hospital=hospital, fmt=fmt)
+
+        if result.get('success'):
+            _write(job_id, 'result', result)
+            state['status'] = 'done'
+        else:
+            state.update(status='failed', error=result.get('error'))
+    except Exception as e:
+        state.update(status='failed', error=str(e))
+    finally:
+        state['finished_at'] = time.time()
+        _write(job_id, 'status', state)
+        with _active_lock:
+            _active.pop(job_id, None)
+        upload.close()
+
+
+def get_status(job_id):
+    """Job state: status (queued, running, done, failed), progress {done, total} and timestamps; None if unknown"""
+    return _read(job_id, 'status')
+
+
+def get_result(job_id):
+    return _read(job_id, 'result')
+
+
+def _prune():
+    """Delete finished jobs older than FORECAST_JOB_TTL"""
+    cutoff = time.time() - FORECAST_JOB_TTL
+    try:
+        names = os.listdir(FORECAST_JOB_DIR)
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith('.status.json'):
+            continue
+        job_id = name.split('.', 1)[0]
+        state = _read(job_id, 'status')
+        if state and state.get('finished_at') and state['finished_at'] < cutoff:
+            for suffix in ('status', 'result'):
+                try:
+                    os.remove(_path(job_id, suffix))
+                except OSError:
+                    pass
+
+
+def queue_stats():
+    with _active_lock:
+        active = len(_active)
+    return {
+        'active': active,
+        'queue_size': FORECAST_JOB_QUEUE_SIZE,
+        'workers': FORECAST_JOB_WORKERS,
+        'per_owner': FORECAST_JOBS_PER_OWNER
+    }
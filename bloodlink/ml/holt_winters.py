@@ -0,0 +1,220 @@
+"""Additive Holt-Winters with weekly seasonality, fitted for many daily series at once.
+
+Every series is left-aligned in one (series, day) array and the smoothing
+recursion runs once over the day axis, updating all series and all candidate
+(alpha, beta, gamma) sets together. Each series gets the candidate with the
+lowest one-step SSE, with its initial states solved by least squares, which
+is what statsmodels' default 'estimated' initialization optimizes as well.
+
+ml.forecast only fits series of at least BATCH_MIN_LENGTH days this way
+and fits shorter ones with statsmodels: on a few months of history the
+two disagree by up to several times a group's weekly demand. From
+BATCH_MIN_LENGTH days on, against statsmodels ExponentialSmoothing(
+trend='add', seasonal='add', seasonal_periods=7).fit(), the median group's
+7-day total agrees within 0.1% of its weekly demand and 95% of groups
+within 5%. Every group further apart has the lower one-step SSE of the
+two: statsmodels' optimizer stopped at a worse optimum, typically on a
+low-volume group whose SSE barely depends on the trend.
+benchmarks/holt_winters.py checks both conditions for every group.
+
+update_state() carries one fitted model forward over newly observed days,
+which is how ml.model_store updates a stored fit without refitting.
+"""
+import numpy as np
+import pandas as pd
+
+SEASON = 7
+MIN_LENGTH = 2 * SEASON
+# Shortest series ml.forecast fits in batch; shorter ones go to statsmodels
+BATCH_MIN_LENGTH = 180
+
+ALPHAS = (0.0, 0.02, 0.05, 0.1, 0.2, 0.35, 0.5, 0.7, 0.9)
+BETAS = (0.0, 0.01, 0.05, 0.15)
+GAMMAS = (0.0, 0.05, 0.15, 0.3, 0.5)
+# Initial states: level, trend and one per weekday
+N_STATES = 2 + SEASON
+
+
+def _grid():
+    """Candidate (alpha, beta, gamma) with statsmodels' bounds beta <= alpha and gamma <= 1 - alpha"""
+    grid = [(a, b, g) for a in ALPHAS for b in BETAS for g in GAMMAS if b <= a and g <= 1 - a]
+    return np.array(grid, dtype=float)
+
+
+def _smooth(values, mask, alpha, beta, gamma, level, trend, season, responses=None, keep_errors=False):
+    """Run the recursion over the day axis for every (candidate, series) pair at once.
+
+    values is (series, days); alpha, beta and gamma broadcast against
+    (candidates, series). Returns the one-step SSE (every error when
+    keep_errors), the errors projected on `responses` (candidates, days,
+    states) when given, and the final states. A series' states stop changing
+    once its mask ends.
+    """
+    shape = np.broadcast_shapes(alpha.shape, values.shape[:-1])
+    level = np.broadcast_to(level, shape).copy()
+    trend = np.broadcast_to(trend, shape).copy()
+    season = np.broadcast_to(season, shape + (SEASON,)).copy()
+    sse = np.zeros(shape)
+    errors = np.zeros(shape + (values.shape[-1],)) if keep_errors else None
+    cross = np.zeros(shape + (responses.shape[-1],)) if responses is not None else None
+
+    for t in range(values.shape[-1]):
+        j = t % SEASON
+        y = values[:, t]
+        live = mask[:, t]
+        s_prev = season[..., j]
+        base = level + trend
+
+        error = np.where(live, y - (base + s_prev), 0.0)
+        new_level = alpha * (y - s_prev) + (1 - alpha) * base
+        new_trend = beta * (new_level - level) + (1 - beta) * trend
+        new_season = gamma * (y - base) + (1 - gamma) * s_prev
+
+        if keep_errors:
+            errors[..., t] = error
+        sse += error * error
+        if cross is not None:
+            cross += error[..., None] * responses[:, None, t, :]
+        level = np.where(live, new_level, level)
+        trend = np.where(live, new_trend, trend)
+        season[..., j] = np.where(live, new_season, s_prev)
+
+    return (errors if keep_errors else sse), cross, level, trend, season
+
+
+def _unit_responses(alpha, beta, gamma, n_days):
+    """(candidates, days, states): the errors each unit initial state causes on all-zero data"""
+    level = np.zeros(N_STATES)
+    trend = np.zeros(N_STATES)
+    season = np.zeros((N_STATES, SEASON))
+    level[0] = trend[1] = 1.0
+    season[2:, :] = np.eye(SEASON)
+
+    zeros = np.zeros((N_STATES, n_days))
+    always = np.ones((N_STATES, n_days), dtype=bool)
+    errors, *_ = _smooth(zeros, always, alpha, beta, gamma, level, trend, season, keep_errors=True)
+    return np.moveaxis(errors, 1, 2)
+
+
+def _fit(values, lengths, horizon):
+    """Grid search with least-squares initial states for every candidate; returns (forecasts, sse).
+
+    The one-step errors are affine in the initial states x: e = e0 + R x, where
+    e0 comes from running on the data with zero states and R (the unit
+    responses) does not depend on the data. So each candidate's best x and its
+    SSE follow from R'R and R'e0 without another pass over the series.
+    """
+    n_series, n_days = values.shape
+    mask = np.arange(n_days)[None, :] < lengths[:, None]
+    grid = _grid()
+    alpha, beta, gamma = (grid[:, k:k + 1] for k in range(3))
+
+    responses = _unit_responses(alpha, beta, gamma, n_days)
+    sse0, cross, *_ = _smooth(values, mask, alpha, beta, gamma, 0.0, 0.0, np.zeros(SEASON), responses=responses)
+
+    # R'R over each series' own length, from a running sum over days
+    gram = np.cumsum(np.einsum('gtk,gtl->gtkl', responses, responses), axis=1)[:, lengths - 1]
+    ridge = 1e-9 * (np.trace(gram, axis1=-2, axis2=-1)[..., None, None] + 1.0) * np.eye(N_STATES)
+    x = -np.linalg.solve(gram + ridge, cross[..., None])[..., 0]
+    sse = sse0 + np.einsum('gsk,gsk->gs', cross, x)
+
+    best = np.argmin(sse, axis=0)
+    series = np.arange(n_series)
+    states = x[best, series]
+    best_sse = sse[best, series]
+    params = [grid[best, k][None, :] for k in range(3)]
+    _, _, level, trend, season = _smooth(values, mask, *params, states[:, 0], states[:, 1], states[:, 2:])
+    level, trend, season = level[0], trend[0], season[0]
+
+    steps_ahead = np.arange(1, horizon + 1)
+    slots = (lengths[:, None] + steps_ahead[None, :] - 1) % SEASON
+    forecasts = level[:, None] + steps_ahead[None, :] * trend[:, None] + np.take_along_axis(season, slots, axis=1)
+    return forecasts, best_sse
+
+
+def fit_series(series_list, horizon=7):
+    """(forecasts, sse): (len(series_list), horizon) forecasts and each series' in-sample one-step SSE.
+
+    Every series needs at least MIN_LENGTH days.
+    """
+    if not series_list:
+        return np.zeros((0, horizon)), np.zeros(0)
+    lengths = np.array([len(s) for s in series_list])
+    if lengths.min() < MIN_LENGTH:
+        raise ValueError(f'Holt-Winters needs at least {MIN_LENGTH} days per series')
+
+    values = np.zeros((len(series_list), lengths.max()))
+    for i, series in enumerate(series_list):
+        values[i, :lengths[i]] = np.asarray(series, dtype=float)
+    return _fit(values, lengths, horizon)
+
+
+def forecast_series(series_list, horizon=7):
+    """(len(series_list), horizon) forecasts; every series needs at least MIN_LENGTH days"""
+    return fit_series(series_list, horizon)[0]
+
+
+def forecast_matrix(matrix, horizon=7):
+    """Forecast every column of a build_daily_matrix() frame long enough to fit.
+
+    Each column is trimmed to its own first and last day, as series_from_matrix
+    does. Returns a frame with one row per step ahead and one column per group.
+    """
+    columns, series_list = [], []
+    for column in matrix.columns:
+        values = matrix[column]
+        first, last = values.first_valid_index(), values.last_valid_index()
+        if first is None:
+            continue
+        series = values.loc[first:last].fillna(0)
+        if len(series) >= MIN_LENGTH:
+            columns.append(column)
+            series_list.append(series)
+
+    forecasts = forecast_series(series_list, horizon)
+    return pd.DataFrame(forecasts.T, index=pd.RangeIndex(1, horizon + 1, name='step'),
+                        columns=pd.MultiIndex.from_tuples(columns, names=matrix.columns.names) if columns else None)
+
+
+def state_from_statsmodels(fit):
+    """Fitted state of a statsmodels additive Holt-Winters result, for update_state().
+
+    season holds the last SEASON seasonal terms; season[0] applies to the next day.
+    mae is the in-sample one-step MAE, the baseline for drift checks.
+    """
+    params = fit.params
+    return {
+        'alpha': float(params['smoothing_level']),
+        'beta': float(params['smoothing_trend']),
+        'gamma': float(params['smoothing_seasonal']),
+        'level': float(fit.level.iloc[-1]),
+        'trend': float(fit.trend.iloc[-1]),
+        'season': [float(v) for v in fit.season.iloc[-SEASON:]],
+        'mae': float(np.abs(fit.resid).mean())
+    }
+
+
+def update_state(state, values):
+    """(state, one-step errors) after running a fitted state over the days that followed it.
+
+    Same recursion and parameters as the original fit, so the result matches
+    refitting the whole history with those parameters held fixed.
+    """
+    alpha, beta, gamma = state['alpha'], state['beta'], state['gamma']
+    level, trend, season = state['level'], state['trend'], list(state['season'])
+    errors = []
+    for y in np.asarray(values, dtype=float):
+        s_prev = season[0]
+        base = level + trend
+        errors.append(y - (base + s_prev))
+        new_level = alpha * (y - s_prev) + (1 - alpha) * base
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        season = season[1:] + [gamma * (y - base) + (1 - gamma) * s_prev]
+        level = new_level
+    return {**state, 'level': level, 'trend': trend, 'season': season}, np.array(errors)
+
+
+def forecast_state(state, horizon=7):
+    steps_ahead = np.arange(1, horizon + 1)
+    season = np.asarray(state['season'])[(steps_ahead - 1) % SEASON]
+    return state['level'] + steps_ahead * state['trend'] + season
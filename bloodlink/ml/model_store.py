@@ -0,0 +1,159 @@
+"""Fitted forecast models per (hospital, department, blood type), kept between uploads.
+
+A record holds the fitted state of every model together with the history it
+was fitted on (start date, length and a digest of the values). When the next
+upload for the same hospital only appends days to that history, plan() asks
+for an update instead of a refit. The record is refit from scratch when:
+- the old history changed
+- too many days were added
+- MODEL_CONFIG changed
+- MODEL_REFIT_EVERY updates have happened since the last full fit
+
+The caller also refits when the new days show drift. Records are pickles
+written by atomic rename, so worker processes can share the directory. They
+hold compact model states (parameters and last filter state, not results
+objects), so a record's size does not grow with the history. Records not
+written for MODEL_STORE_MAX_AGE_DAYS are dropped, and the least recently
+written go once the directory grows past MODEL_STORE_MAX_BYTES. evict()
+walks the whole store, so the web process runs it once per upload rather
+than the workers once per saved group.
+"""
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+MODEL_STORE_DIR = os.environ.get('BLOODLINK_MODEL_STORE_DIR', 'model_store')
+# Set BLOODLINK_MODEL_STORE=0 to refit every upload
+MODEL_STORE_ENABLED = os.environ.get('BLOODLINK_MODEL_STORE', '1') != '0'
+# Incremental updates allowed between two full refits
+MODEL_REFIT_EVERY = int(os.environ.get('BLOODLINK_MODEL_REFIT_EVERY', 6))
+# Most new days an update may absorb; longer gaps are refit
+MODEL_MAX_UPDATE_DAYS = int(os.environ.get('BLOODLINK_MODEL_MAX_UPDATE_DAYS', 28))
+# Refit when the stored model's one-step MAE on the new days exceeds this multiple of its in-sample MAE
+MODEL_DRIFT_RATIO = float(os.environ.get('BLOODLINK_MODEL_DRIFT_RATIO', 2.0))
+# Records of groups no upload has touched for this many days are deleted
+MODEL_STORE_MAX_AGE_DAYS = float(os.environ.get('BLOODLINK_MODEL_STORE_MAX_AGE_DAYS', 90))
+# Size of the store directory past which the least recently written records are deleted
+MODEL_STORE_MAX_BYTES = int(os.environ.get('BLOODLINK_MODEL_STORE_MAX_BYTES', 100 * 1024 * 1024))
+
+# Counted by the web process from the entries forecast_group() returns and its evict() calls
+_stats = {'updates': 0, 'refits': 0, 'evictions': 0}
+_stats_lock = threading.Lock()
+
+
+def count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def _digest(series):
+    return hashlib.sha256(series.to_numpy(dtype='float64').tobytes()).hexdigest()
+
+
+def _path(hospital, dept, bt):
+    key = hashlib.sha256('\0'.join((str(hospital), str(dept), str(bt))).encode()).hexdigest()
+    return os.path.join(MODEL_STORE_DIR, key[:2], f'{key}.pkl')
+
+
+def load(hospital, dept, bt):
+    """Stored record or None"""
+    try:
+        with open(_path(hospital, dept, bt), 'rb') as f:
+            record = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    return record
+
+
+def save(hospital, dept, bt, series, config, models, backtest=None, updates=0, fitted_at=None):
+    """Store models fitted on series with their backtest report.
+
+    updates counts incremental updates since the full fit at fitted_at.
+    """
+    record = {
+        'key': [hospital, dept, bt],
+        'config': config,
+        'start': series.index[0],
+        'length': len(series),
+        'digest': _digest(series),
+        'models': models,
+        'backtest': backtest,
+        'updates': updates,
+        'fitted_at': fitted_at or time.time(),
+        'updated_at': time.time()
+    }
+    path = _path(hospital, dept, bt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    return record
+
+
+def plan(record, series, config):
+    """(new days, None) when record can be updated to cover series, or (None, reason to refit)"""
+    if record is None:
+        return None, 'no stored model'
+    if record['config'] != config:
+        return None, 'model configuration changed'
+    if series.index[0] != record['start'] or len(series) < record['length']:
+        return None, 'history changed'
+    if _digest(series.iloc[:record['length']]) != record['digest']:
+        return None, 'history changed'
+
+    new_days = series.iloc[record['length']:]
+    if len(new_days) > MODEL_MAX_UPDATE_DAYS:
+        return None, f'{len(new_days)} new days'
+    if record['updates'] >= MODEL_REFIT_EVERY:
+        return None, 'retraining cadence reached'
+    return new_days, None
+
+
+def _entries():
+    entries = []
+    for root, _, files in os.walk(MODEL_STORE_DIR):
+        for name in files:
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+    return entries
+
+
+def evict():
+    """Drop records older than MODEL_STORE_MAX_AGE_DAYS, then the oldest until under 90% of MODEL_STORE_MAX_BYTES"""
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    cutoff = time.time() - MODEL_STORE_MAX_AGE_DAYS * 86400
+    target = MODEL_STORE_MAX_BYTES * 0.9 if total > MODEL_STORE_MAX_BYTES else total
+
+    for mtime, size, path in entries:
+        if mtime >= cutoff and total <= target:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        count('evictions')
+
+
+def store_stats():
+    entries = _entries()
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['enabled'] = MODEL_STORE_ENABLED
+    stats['refit_every'] = MODEL_REFIT_EVERY
+    stats['drift_ratio'] = MODEL_DRIFT_RATIO
+    stats['entries'] = len(entries)
+    stats['bytes'] = sum(size for _, size, _ in entries)
+    stats['max_bytes'] = MODEL_STORE_MAX_BYTES
+    stats['max_age_days'] = MODEL_STORE_MAX_AGE_DAYS
+    return stats
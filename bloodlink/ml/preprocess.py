@@ -1,31 +1,137 @@
+import os
 import pandas as pd
 import numpy as np
 
-def load_and_preprocess_data(filepath):
+# Rows read per chunk; memory stays proportional to this, not to the file
+INGEST_CHUNK_ROWS = int(os.environ.get('BLOODLINK_INGEST_CHUNK_ROWS', 200_000))
+
+FORMATS = ('csv', 'xlsx', 'xls', 'parquet')
+COLUMN_MAPPING = {
+    'date': 'timestamp', 'datetime': 'timestamp', 'time': 'timestamp',
+    'blood type': 'blood_type', 'unit': 'units', 'dept': 'department'
+}
+REQUIRED_COLUMNS = ('timestamp', 'department', 'blood_type', 'units')
+
+
+def _canonical(name):
+    name = str(name).lower().strip()
+    return COLUMN_MAPPING.get(name, name)
+
+
+def _source_columns(names):
+    """{canonical name: column name in the file} for the columns the forecast reads"""
+    columns = {}
+    for name in names:
+        canonical = _canonical(name)
+        if canonical in REQUIRED_COLUMNS and canonical not in columns:
+            columns[canonical] = name
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    return columns
+
+
+def _csv_chunks(source):
+    header = pd.read_csv(source, nrows=0).columns
+    if hasattr(source, 'seek'): source.seek(0)
+    columns = _source_columns(header)
+    dtype = {columns['department']: 'category', columns['blood_type']: 'category', columns['timestamp']: str}
+    reader = pd.read_csv(source, usecols=list(columns.values()), dtype=dtype, chunksize=INGEST_CHUNK_ROWS)
+    for chunk in reader:
+        yield chunk.rename(columns={v: k for k, v in columns.items()})
+
+
+def _xlsx_chunks(source):
+    """Rows of the first sheet in INGEST_CHUNK_ROWS frames, streamed by openpyxl's read-only mode"""
+    from openpyxl import load_workbook
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        columns = _source_columns([name for name in header if name is not None])
+        positions = {canonical: list(header).index(name) for canonical, name in columns.items()}
+        batch = []
+        for row in rows:
+            batch.append([row[i] if i < len(row) else None for i in positions.values()])
+            if len(batch) >= INGEST_CHUNK_ROWS:
+                yield pd.DataFrame(batch, columns=list(positions))
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=list(positions))
+    finally:
+        workbook.close()
+
+
+def _xls_chunks(source):
+    # Legacy .xls has no streaming reader; only the needed columns are kept
+    df = pd.read_excel(source, usecols=lambda name: _canonical(name) in REQUIRED_COLUMNS)
+    columns = _source_columns(df.columns)
+    yield df[list(columns.values())].rename(columns={v: k for k, v in columns.items()})
+
+
+def _parquet_chunks(source):
+    import pyarrow.parquet as pq
+    parquet = pq.ParquetFile(source)
+    columns = _source_columns(parquet.schema_arrow.names)
+    for batch in parquet.iter_batches(batch_size=INGEST_CHUNK_ROWS, columns=list(columns.values())):
+        yield batch.to_pandas().rename(columns={v: k for k, v in columns.items()})
+
+
+_READERS = {'csv': _csv_chunks, 'xlsx': _xlsx_chunks, 'xls': _xls_chunks, 'parquet': _parquet_chunks}
+
+
+def _labels(column, fill, upper=False):
+    """Categorical column with missing values filled; the string work is done on the categories, not the rows"""
+    column = column.astype('category')
+    labels = pd.Index([str(c) for c in column.cat.categories] + [fill])
+    if upper: labels = labels.str.upper()
+    # Code -1 (missing) picks the trailing fill label
+    return pd.Categorical(labels)[column.cat.codes.to_numpy()]
+
+
+def _daily_chunk(chunk):
+    """One chunk cleaned like the old row-level frame, then summed per (day, department, blood type)"""
+    timestamps = pd.to_datetime(chunk['timestamp'], errors='coerce')
+    keep = timestamps.notna().to_numpy()
+    days = timestamps[keep].dt.normalize()
+    if days.dt.tz is not None:
+        days = days.dt.tz_localize(None)
+
+    clean = pd.DataFrame({
+        'timestamp': days.to_numpy(),
+        'department': _labels(chunk['department'], 'General')[keep],
+        'blood_type': _labels(chunk['blood_type'], 'Unknown', upper=True)[keep],
+        'units': pd.to_numeric(chunk['units'], errors='coerce').fillna(0).to_numpy(dtype=float)[keep]
+    })
+    return clean.groupby(['timestamp', 'department', 'blood_type'], sort=False, observed=True)['units'].sum()
+
+
+def load_and_preprocess_data(source, fmt=None):
+    """Read a demand file into one row per (day, department, blood type) with the day's total units.
+
+    source is a path or a binary file object (fmt, one of FORMATS, is then
+    required). Only the needed columns are read, INGEST_CHUNK_ROWS rows at a
+    time with categorical department/blood type, and each chunk is summed per
+    day before the next is read, so memory follows the number of groups and
+    days rather than the file size. Rows keep their file order of first
+    appearance. Returns (df, None) or (None, error).
+    """
     try:
-        if filepath.endswith('.csv'):
-            df = pd.read_csv(filepath)
-        elif filepath.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(filepath)
-        else:
+        if fmt is None:
+            fmt = os.path.splitext(str(source))[1].lstrip('.').lower()
+        if fmt not in FORMATS:
             return None, "Unsupported file format"
-        
-        df.columns = df.columns.str.lower().str.strip()
-        column_mapping = {
-            'date': 'timestamp', 'datetime': 'timestamp', 'time': 'timestamp',
-            'blood type': 'blood_type', 'unit': 'units', 'dept': 'department'
-        }
-        df = df.rename(columns=column_mapping)
-        
-        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-        df = df.dropna(subset=['timestamp'])
-        
-        # Standardize strings
-        df['blood_type'] = df['blood_type'].fillna('Unknown').astype(str).str.upper()
-        df['department'] = df['department'].fillna('General')
-        df['units'] = pd.to_numeric(df['units'], errors='coerce').fillna(0)
-        
-        return df, None
+
+        parts = [_daily_chunk(chunk) for chunk in _READERS[fmt](source)]
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return pd.DataFrame({'timestamp': pd.Series(dtype='datetime64[ns]'), 'department': pd.Categorical([]),
+                                 'blood_type': pd.Categorical([]), 'units': pd.Series(dtype=float)}), None
+
+        # Chunks have different categories, so the keys are combined as plain values and re-categorized once
+        daily = pd.concat([part.reset_index().astype({'department': object, 'blood_type': object}) for part in parts])
+        df = daily.groupby(['timestamp', 'department', 'blood_type'], sort=False)['units'].sum().reset_index()
+        return df.astype({'department': 'category', 'blood_type': 'category'}), None
     except Exception as e:
         return None, str(e)
 
@@ -42,3 +148,34 @@ def get_clean_series(df, dept, bt):
     # Reindex to fill missing dates with 0 (Crucial for Statsmodels)
     daily = daily.set_index('date').resample('D').asfreq().fillna(0)
     return daily['units']
+
+
+def build_daily_matrix(df):
+    """Daily units for every group in one pass: indexed by date, one (department, blood_type) column per group.
+
+    The date range is filled once for the whole frame. Days without rows stay
+    NaN so each group keeps its own first/last day; use series_from_matrix().
+    """
+    if df.empty:
+        return pd.DataFrame()
+
+    dates = df['timestamp'].dt.normalize()
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+
+    daily = df.groupby([dates.rename('date'), df['department'], df['blood_type']], observed=True)['units'].sum()
+    matrix = daily.unstack(['department', 'blood_type'])
+    full_range = pd.date_range(matrix.index.min(), matrix.index.max(), freq='D', name='date')
+    return matrix.reindex(full_range).astype(float)
+
+
+def series_from_matrix(matrix, dept, bt):
+    """Same series as get_clean_series(df, dept, bt), read from a build_daily_matrix() result"""
+    if (dept, bt) not in matrix.columns: return None
+    column = matrix[(dept, bt)]
+    first, last = column.first_valid_index(), column.last_valid_index()
+    if first is None: return None
+
+    series = column.loc[first:last].fillna(0)
+    series.name = 'units'
+    return series
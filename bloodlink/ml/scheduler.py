@@ -0,0 +1,80 @@
+"""Time budgets for forecast jobs and the models fitted inside them.
+
+A job gets FORECAST_JOB_BUDGET seconds, and each group gets at most
+FORECAST_GROUP_BUDGET of what is left. Inside a group the models run
+cheapest first. The cheapest one always runs; a more expensive one only
+starts while its expected cost still fits the group's remaining time.
+Expected costs are running averages of the times the web process observes
+as groups complete, starting from DEFAULT_COSTS. Worker processes do not
+learn costs themselves; each group they fit carries the web process's table
+(expected_costs/use_costs). Deadlines are wall-clock timestamps, so they can
+be passed to worker processes too.
+"""
+import os
+import threading
+import time
+
+FORECAST_JOB_BUDGET = float(os.environ.get('BLOODLINK_FORECAST_JOB_BUDGET', 300))
+FORECAST_GROUP_BUDGET = float(os.environ.get('BLOODLINK_FORECAST_GROUP_BUDGET', 60))
+# Extra seconds a job waits for groups still running at its deadline before replacing them with the fast model
+FORECAST_BUDGET_GRACE = float(os.environ.get('BLOODLINK_FORECAST_BUDGET_GRACE', 10))
+
+# Seconds per group, backtest included, assumed until a task has been timed
+DEFAULT_COSTS = {
+    'holt_winters': 0.3, 'sarimax': 2.0, 'prophet': 3.0,
+    'holt_winters:update': 0.01, 'sarimax:update': 0.2, 'prophet:update': 1.5
+}
+# Weight of the newest timing in the running average
+_SMOOTHING = 0.3
+
+_costs = dict(DEFAULT_COSTS)
+_costs_lock = threading.Lock()
+
+
+def job_deadline(budget=None):
+    return time.time() + (FORECAST_JOB_BUDGET if budget is None else budget)
+
+
+def group_deadline(job_deadline=None):
+    """The earlier of FORECAST_GROUP_BUDGET from now and the job's deadline"""
+    deadline = time.time() + FORECAST_GROUP_BUDGET
+    return deadline if job_deadline is None else min(deadline, job_deadline)
+
+
+def remaining(deadline):
+    return max(0.0, deadline - time.time())
+
+
+def affordable(task, deadline):
+    """Whether task's expected cost fits before deadline"""
+    with _costs_lock:
+        cost = _costs.get(task, 0.0)
+    return time.time() + cost <= deadline
+
+
+def observe(task, seconds):
+    with _costs_lock:
+        previous = _costs.get(task)
+        _costs[task] = seconds if previous is None else (1 - _SMOOTHING) * previous + _SMOOTHING * seconds
+
+
+def expected_costs():
+    with _costs_lock:
+        return dict(_costs)
+
+
+def use_costs(costs):
+    """Adopt another process's expected costs, e.g. the web process's in a pool worker"""
+    with _costs_lock:
+        _costs.update(costs)
+
+
+def cost_stats():
+    with _costs_lock:
+        costs = {task: round(cost, 3) for task, cost in _costs.items()}
+    return {
+        'job_budget': FORECAST_JOB_BUDGET,
+        'group_budget': FORECAST_GROUP_BUDGET,
+        'grace': FORECAST_BUDGET_GRACE,
+        'expected_costs': costs
+    }
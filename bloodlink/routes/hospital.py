@@ -1,19 +1,32 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, Response
 from firebase.firestore_service import create_hospital_request
-from ml.forecast import predict_blood_demand
-from werkzeug.utils import secure_filename
 import os
+import shutil
+import tempfile
 
 hospital_bp = Blueprint('hospital', __name__)
 
-UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
-
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls', 'parquet'}
+# Queued uploads up to this size are buffered in memory; larger ones spill to a private temp file
+UPLOAD_SPOOL_BYTES = int(os.environ.get('BLOODLINK_UPLOAD_SPOOL_BYTES', 32 * 1024 * 1024))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _upload_format(filename):
+    return filename.rsplit('.', 1)[1].lower()
+
+def _spool_upload(file):
+    """Copy an upload into a spooled buffer the caller owns, rewound for reading"""
+    buffer = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    shutil.copyfileobj(file.stream, buffer, 1024 * 1024)
+    buffer.seek(0)
+    return buffer
+
+def _job_owner():
+    """Jobs are scoped to the hospital in the session"""
+    return session.get('hospital_name') or request.remote_addr
+
 @hospital_bp.route('/dashboard', methods=['GET', 'POST'])
 def dashboard():
     if request.method == 'POST':
@@ -47,20 +60,86 @@ def predict_demand():
         return jsonify({'success': False, 'error': 'No file selected'})
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        
-        # Run prediction
-        result = predict_blood_demand(filepath)
-        
-        # Clean up uploaded file
-        os.remove(filepath)
+        # Run prediction straight from the request's upload buffer; the forecasting stack is only imported on first use
+        from ml.forecast import predict_blood_demand
+        result = predict_blood_demand(file.stream, fmt=_upload_format(file.filename),
+                                      charts=request.values.get('charts', 'png'),
+                                      model=request.values.get('model', 'ensemble'),
+                                      hospital=session.get('hospital_name'))
         
         return jsonify(result)
     
     return jsonify({'success': False, 'error': 'Invalid file format'})
 
+@hospital_bp.route('/forecast-jobs', methods=['POST'])
+def submit_forecast_job():
+    """Queue a forecast of the uploaded file; poll /forecast-jobs/<job_id> for progress"""
+    from ml.forecast_jobs import QueueFull, submit
+
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({'success': False, 'error': 'No file selected'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'success': False, 'error': 'Invalid file format'}), 400
+
+    # The request's buffer is gone once the response is sent, so the job gets its own copy
+    upload = _spool_upload(file)
+    try:
+        job_id = submit(upload, _upload_format(file.filename), _job_owner(), charts=request.form.get('charts', 'data'),
+                        model=request.form.get('model', 'ensemble'), hospital=session.get('hospital_name'))
+    except QueueFull as e:
+        upload.close()
+        return jsonify({'success': False, 'error': str(e)}), 429
+
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('hospital.forecast_job_status', job_id=job_id)
+    }), 202
+
+@hospital_bp.route('/forecast-jobs/<job_id>')
+def forecast_job_status(job_id):
+    from ml.forecast_jobs import get_status
+
+    state = get_status(job_id)
+    if not state or state.get('owner') != _job_owner():
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+
+    state = {k: v for k, v in state.items() if k != 'owner'}
+    if state['status'] == 'done':
+        state['result_url'] = url_for('hospital.forecast_job_result', job_id=job_id)
+    return jsonify({'success': True, **state})
+
+@hospital_bp.route('/forecast-jobs/<job_id>/result')
+def forecast_job_result(job_id):
+    from ml.forecast_jobs import get_result, get_status
+
+    state = get_status(job_id)
+    if not state or state.get('owner') != _job_owner():
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    if state['status'] != 'done':
+        return jsonify({'success': False, 'error': state.get('error') or 'Forecast is not finished', 'status': state['status']}), 409
+
+    return jsonify(get_result(job_id))
+
+@hospital_bp.route('/forecast-jobs/<job_id>/charts/<chart_id>.png')
+def forecast_job_chart(job_id, chart_id):
+    """One group's chart as a PNG, drawn on request from the job's chart data"""
+    from ml.forecast_jobs import get_result, get_status
+
+    state = get_status(job_id)
+    if not state or state.get('owner') != _job_owner() or state['status'] != 'done':
+        return jsonify({'success': False, 'error': 'Chart not found'}), 404
+    data = (get_result(job_id) or {}).get('chart_data', {}).get(chart_id)
+    if not data:
+        return jsonify({'success': False, 'error': 'Chart not found'}), 404
+
+    from ml.charts import render_png
+    response = Response(render_png(data), mimetype='image/png')
+    response.cache_control.private = True
+    response.cache_control.max_age = 3600
+    return response
+
 @hospital_bp.route('/emergency-request', methods=['POST'])
 def emergency_request():
     hospital_name = session.get('hospital_name')
@@ -80,4 +159,17 @@ def emergency_request():
     else:
         flash(f'Error: {result["error"]}', 'error')
     
-    return redirect(url_for('hospital.dashboard'))
\ No newline at end of file
+    return redirect(url_for('hospital.dashboard'))
+
+@hospital_bp.route('/forecast-cache/invalidate', methods=['POST'])
+def invalidate_forecast_cache():
+    """Drop the session hospital's cached forecasts so its next upload recomputes every group.
+
+    Stored models are kept: they are only replaced by the refits the model store schedules.
+    """
+    hospital_name = session.get('hospital_name')
+    if not hospital_name:
+        return jsonify({'success': False, 'error': 'Hospital information not set'}), 403
+
+    from ml import forecast_cache
+    return jsonify({'success': True, 'removed': forecast_cache.clear(hospital_name)})
@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import os
+import time
+
+ROUTE_WORKERS = int(os.environ.get('BLOODLINK_ROUTE_WORKERS', 16))
+# Seconds a handler waits for its parallel service calls before giving up on them
+ROUTE_CALL_TIMEOUT = float(os.environ.get('BLOODLINK_ROUTE_CALL_TIMEOUT', 10))
+
+_pool = ThreadPoolExecutor(max_workers=ROUTE_WORKERS, thread_name_prefix='route-call')
+
+
+def run_parallel(timeout=ROUTE_CALL_TIMEOUT, **calls):
+    """Run independent service calls concurrently and return their results by name.
+
+    Each call is a zero-argument callable returning the usual
+    {'success': ..., 'error': ...} dict. A call that raises or misses the shared
+    deadline yields {'success': False, 'error': ...} without affecting the others.
+    """
+    futures = {name: _pool.submit(call) for name, call in calls.items()}
+    deadline = time.monotonic() + timeout
+
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            future.cancel()
+            results[name] = {'success': False, 'error': f'{name} timed out'}
+        except Exception as e:
+            results[name] = {'success': False, 'error': str(e)}
+
+    return results
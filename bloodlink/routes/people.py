@@ -2,20 +2,25 @@ from flask import Blueprint, render_template, request, redirect, url_for, sessio
 from firebase.firestore_service import (
     create_blood_request, get_pending_requests, accept_donation_slot,
     get_user_requests, get_user_donations, update_user_location,
-    verify_donation, get_request_donations, delete_user_donation
+    verify_donation, get_request_donations, delete_user_donation, get_user_request
 )
 from firebase.auth_service import get_user_data
+from routes.parallel import run_parallel
 from functools import wraps
 
 people_bp = Blueprint('people', __name__)
 
+# Items per page for the listing pages and their JSON endpoints
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
 def login_required(f):
     """Decorator to require login"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'uid' not in session:
             # For API endpoints, return JSON error
-            if request.path.startswith('/people/accept-') or request.path.startswith('/people/verify-'):
+            if request.path.startswith(('/people/accept-', '/people/verify-', '/people/api/')):
                 return jsonify({'success': False, 'error': 'Not logged in. Please refresh and login again.'}), 401
             flash('Please login first', 'error')
             return redirect(url_for('auth.login'))
@@ -76,15 +81,41 @@ def request_blood():
 @people_bp.route('/donate-blood')
 @login_required
 def donate_blood():
-    # Get all pending requests
-    result = get_pending_requests()
+    # First page of pending requests, near the donor when their location is known
+    result = get_pending_requests(user_location=_donor_location(), limit=PAGE_SIZE)
     
     if result['success']:
         requests = result['requests']
-        return render_template('donate_blood.html', requests=requests)
+        return render_template('donate_blood.html', requests=requests, next_cursor=result['next_cursor'])
     else:
         flash(f'Error: {result["error"]}', 'error')
-        return render_template('donate_blood.html', requests=[])
+        return render_template('donate_blood.html', requests=[], next_cursor=None)
+
+def _donor_location():
+    user_result = get_user_data(session.get('uid'))
+    return user_result['data'].get('location') if user_result['success'] else None
+
+def _page_args():
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    return limit, request.args.get('cursor') or None
+
+@people_bp.route('/api/pending-requests')
+@login_required
+def pending_requests_page():
+    limit, cursor = _page_args()
+    return jsonify(get_pending_requests(user_location=_donor_location(), limit=limit, cursor=cursor))
+
+@people_bp.route('/api/my-requests')
+@login_required
+def my_requests_page():
+    limit, cursor = _page_args()
+    return jsonify(get_user_requests(session.get('uid'), limit=limit, cursor=cursor))
+
+@people_bp.route('/api/my-donations')
+@login_required
+def my_donations_page():
+    limit, cursor = _page_args()
+    return jsonify(get_user_donations(session.get('uid'), limit=limit, cursor=cursor))
 
 @people_bp.route('/accept-donation/<request_id>', methods=['POST'])
 @login_required
@@ -161,14 +192,21 @@ def delete_donation(donation_id):
 def orders():
     uid = session.get('uid')
     
-    # Get user's requests
-    requests_result = get_user_requests(uid)
-    donations_result = get_user_donations(uid)
+    # First page of the user's requests and donations, fetched in parallel
+    results = run_parallel(
+        requests=lambda: get_user_requests(uid, limit=PAGE_SIZE),
+        donations=lambda: get_user_donations(uid, limit=PAGE_SIZE)
+    )
+    requests_result = results['requests']
+    donations_result = results['donations']
     
     user_requests = requests_result['requests'] if requests_result['success'] else []
     user_donations = donations_result['donations'] if donations_result['success'] else []
+    requests_cursor = requests_result.get('next_cursor')
+    donations_cursor = donations_result.get('next_cursor')
     
-    return render_template('orders.html', requests=user_requests, donations=user_donations)
+    return render_template('orders.html', requests=user_requests, donations=user_donations,
+                           requests_cursor=requests_cursor, donations_cursor=donations_cursor)
 
 @people_bp.route('/credits')
 @login_required
@@ -187,18 +225,20 @@ def credits():
 @people_bp.route('/request-details/<request_id>')
 @login_required
 def request_details(request_id):
-    # Get request details
-    requests_result = get_user_requests(session.get('uid'))
-    user_request = None
+    uid = session.get('uid')
+    
+    # The request (if the user made it) and its donations are independent reads
+    results = run_parallel(
+        request=lambda: get_user_request(uid, request_id),
+        donations=lambda: get_request_donations(request_id)
+    )
     
-    if requests_result['success']:
-        for req in requests_result['requests']:
-            if req['id'] == request_id:
-                user_request = req
-                break
+    # Get request details
+    request_result = results['request']
+    user_request = request_result['request'] if request_result['success'] else None
     
     # Get donations for this request
-    donations_result = get_request_donations(request_id)
+    donations_result = results['donations']
     donations = donations_result['donations'] if donations_result['success'] else []
     
     return render_template('request_details.html', request=user_request, donations=donations)
@@ -0,0 +1,68 @@
+"""Import-cost report for worker startup.
+
+    python startup.py            # or: flask import-report
+
+Imports the app in a fresh interpreter with -X importtime, then the forecasting
+stack on top of it, and prints the import time per top-level package together
+with the peak RSS of each stage.
+"""
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+STAGES = [
+    ('web app', 'import app'),
+    ('+ forecasting', 'import app; import ml.forecast'),
+]
+
+
+def _parse(stderr):
+    per_package = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        per_package[name.split('.')[0]] += int(self_us)
+    return per_package
+
+
+def import_report(top=15):
+    """Import cost of each stage: total ms, peak RSS and the most expensive packages"""
+    report = []
+    for label, statement in STAGES:
+        code = f'{statement}; import resource; print("RSS_KB", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)'
+        env = dict(os.environ)
+        # No credentials needed just to measure imports
+        env.setdefault('BLOODLINK_DB_BACKEND', 'memory')
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+        if proc.returncode != 0:
+            lines = proc.stderr.strip().splitlines()
+            report.append({'stage': label, 'error': lines[-1] if lines else 'import failed'})
+            continue
+
+        per_package = _parse(proc.stderr)
+        rss_kb = next((int(line.split()[1]) for line in proc.stdout.splitlines() if line.startswith('RSS_KB')), 0)
+        packages = sorted(per_package.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        report.append({
+            'stage': label,
+            'import_ms': round(sum(per_package.values()) / 1000, 1),
+            'rss_mb': round(rss_kb / 1024, 1),
+            'packages': [(name, round(us / 1000, 1)) for name, us in packages]
+        })
+    return report
+
+
+def print_import_report(top=15):
+    for stage in import_report(top):
+        if 'error' in stage:
+            print(f"{stage['stage']}: failed - {stage['error']}")
+            continue
+        print(f"{stage['stage']}: {stage['import_ms']:.0f} ms of imports, peak RSS {stage['rss_mb']:.0f} MB")
+        for name, ms in stage['packages']:
+            print(f'    {name:<24} {ms:>8.1f} ms')
+
+
+if __name__ == '__main__':
+    print_import_report()
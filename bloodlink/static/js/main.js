@@ -28,6 +28,55 @@ function formatDate(dateString) {
     });
 }
 
+// Escape text before inserting it into HTML
+function escapeHtml(value) {
+    return String(value ?? '').replace(/[&<>"']/g, ch => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    }[ch]));
+}
+
+// Load further pages of a paginated JSON endpoint when the sentinel scrolls into view.
+// The sentinel carries data-url, data-cursor and data-target (id of the list to append to).
+function loadMoreOnScroll(sentinel, key, renderItem) {
+    if (!sentinel) return;
+    let cursor = sentinel.dataset.cursor;
+    let loading = false;
+    const target = document.getElementById(sentinel.dataset.target);
+
+    if (!cursor || !target) {
+        sentinel.remove();
+        return;
+    }
+
+    const observer = new IntersectionObserver(async entries => {
+        if (!entries[0].isIntersecting || loading || !cursor) return;
+        loading = true;
+        try {
+            const response = await fetch(`${sentinel.dataset.url}?cursor=${encodeURIComponent(cursor)}`);
+            const result = await response.json();
+            if (!result.success) throw new Error(result.error);
+
+            target.insertAdjacentHTML('beforeend', result[key].map(renderItem).join(''));
+            cursor = result.next_cursor;
+
+            if (!cursor) {
+                observer.disconnect();
+                sentinel.remove();
+            } else {
+                // Re-observe so a sentinel that is still visible fires again
+                observer.unobserve(sentinel);
+                observer.observe(sentinel);
+            }
+        } catch (err) {
+            console.error('Failed to load more:', err);
+        } finally {
+            loading = false;
+        }
+    }, { rootMargin: '200px' });
+
+    observer.observe(sentinel);
+}
+
 // Show loading spinner
 function showLoading(element) {
     if (element) {